@@ -0,0 +1,244 @@
+"""End to end benchmarks of CodeSlim on synthetic packages.
+
+Usage:
+    python benchmarks/bench.py                              # run and compare with baseline.json
+    python benchmarks/bench.py --scales small medium -o result.json
+    python benchmarks/bench.py --save-baseline              # overwrite baseline.json
+
+Every scale generates a package with `synthetic.generate_project`, then times
+`FileEntry`, `DefaultASTParser`, `Parser`, `FileLevelCodeGenerator` and `SegmentCodeGenerator`,
+keeping the best of `--repeat` runs. The process exits with 1 when a phase is
+slower than the baseline by more than `--tolerance`.
+
+The timings are compared relative to a calibration loop timed on each machine,
+so a baseline recorded elsewhere still applies, up to the noise of the loop.
+"""
+
+import argparse
+import ast
+import json
+import os.path as osp
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict
+
+from synthetic import generate_project, project_files, project_size
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+
+from codeslim import (  # noqa: E402
+    ClassMerging,
+    DefaultASTParser,
+    FileEntry,
+    FileLevelCodeGenerator,
+    Parser,
+    SegmentCodeGenerator,
+)
+
+BASELINE = osp.join(osp.dirname(osp.abspath(__file__)), 'baseline.json')
+
+SCALES = {
+    'small': dict(files=20, depth=4, fanout=2, relative=True, class_depth=2, file_size=10),
+    'medium': dict(files=100, depth=8, fanout=3, relative=True, class_depth=3, file_size=20),
+    'large': dict(files=400, depth=12, fanout=3, relative=False, class_depth=3, file_size=40),
+    'deep': dict(files=200, depth=100, fanout=1, relative=True, class_depth=6, file_size=10),
+}
+
+PHASES = ('entry', 'analyze', 'parser', 'file_codegen', 'segment_codegen')
+
+
+def _forget_modules(name):
+    # the import resolver imports the package, drop it so every run resolves it again
+    for module in list(sys.modules):
+        if module == name or module.startswith(name + '.'):
+            del sys.modules[module]
+
+
+def _timeit(func, repeat, setup=None):
+    best = float('inf')
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def calibrate(repeat: int = 5) -> float:
+    """Seconds taken by a fixed parse and walk, the speed of this machine."""
+    source = ''.join(
+        f'def f{i}(a, b=1):\n    return [a * b for _ in range({i})]\n' for i in range(200)
+    )
+
+    def work():
+        for _ in range(10):
+            for _ in ast.walk(ast.parse(source)):
+                pass
+
+    return _timeit(work, repeat)
+
+
+def run_scale(params: Dict, repeat: int = 3, resolver: str = 'import') -> Dict:
+    root = tempfile.mkdtemp(prefix='codeslim-bench-')
+    sys.path.insert(0, root)
+    try:
+        entry_file = generate_project(root, **params)
+        out_dir = osp.join(root, 'out')
+        files = project_files(osp.join(root, 'synth'))
+
+        def build_entry():
+            # parse every file of the package
+            entry = FileEntry(files)
+            entry.asts
+            return entry
+
+        def analyze(entry):
+            # the ast walk of every file alone
+            for file, tree in entry:
+                DefaultASTParser(tree, None, file)
+
+        def build_parser():
+            _forget_modules('synth')
+            return Parser(FileEntry(entry_file), resolver=resolver)
+
+        def file_codegen(parser):
+            FileLevelCodeGenerator(out_dir, parser).generate()
+
+        def segment_codegen(parser):
+            SegmentCodeGenerator(
+                out_dir, parser, class_merge_level=ClassMerging.Eliminate
+            ).generate()
+
+        def fresh_parser():
+            shutil.rmtree(out_dir, ignore_errors=True)
+            return (build_parser(),)
+
+        parser = build_parser()
+        timings = {
+            'entry': _timeit(build_entry, repeat),
+            'analyze': _timeit(analyze, repeat, lambda: (build_entry(),)),
+            'parser': _timeit(build_parser, repeat),
+            # the code generators rewrite the asts in place, so each run gets a new parser
+            'file_codegen': _timeit(file_codegen, repeat, fresh_parser),
+            'segment_codegen': _timeit(segment_codegen, repeat, fresh_parser),
+        }
+        return {
+            'params': params,
+            'project': project_size(osp.join(root, 'synth')),
+            'traced': len(parser.get_parsers()),
+            'timings': timings,
+        }
+    finally:
+        sys.path.remove(root)
+        _forget_modules('synth')
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def run(scales, repeat=3, resolver='import'):
+    results = {}
+    for name in scales:
+        print(f'running {name} ...', file=sys.stderr)
+        results[name] = run_scale(SCALES[name], repeat, resolver)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'resolver': resolver,
+            'calibration': calibrate(),
+        },
+        'results': results,
+    }
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float, min_time: float = 0.0):
+    """Returns the report lines and the regressions, i.e. the (scale, phase)
+    slower than the baseline by more than `tolerance`. Phases faster than
+    `min_time` are too noisy and never regress.
+
+    The baseline timings are scaled by the ratio of the calibrations of both runs."""
+    expected_speed, current_speed = baseline['meta']['calibration'], results['meta']['calibration']
+    speed = current_speed / expected_speed
+    lines = [
+        f'calibration {expected_speed:.4f}s -> {current_speed:.4f}s',
+        f'{"scale":<8} {"phase":<16} {"baseline":>10} {"current":>10} {"ratio":>7}',
+    ]
+    regressions = []
+    for scale, result in results['results'].items():
+        base = baseline.get('results', {}).get(scale)
+        for phase in PHASES:
+            current = result['timings'][phase]
+            if base is None or phase not in base['timings']:
+                lines.append(f'{scale:<8} {phase:<16} {"-":>10} {current:>10.4f} {"-":>7}')
+                continue
+            expected = base['timings'][phase] * speed
+            ratio = current / expected if expected else float('inf')
+            flag = ''
+            if ratio > 1 + tolerance and current > min_time:
+                regressions.append((scale, phase))
+                flag = ' REGRESSION'
+            lines.append(
+                f'{scale:<8} {phase:<16} {expected:>10.4f} {current:>10.4f} {ratio:>7.2f}{flag}'
+            )
+    return lines, regressions
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    arg_parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=list(SCALES))
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--resolver', choices=['import', 'static'], default='import')
+    arg_parser.add_argument('-o', '--output', help='write the results as json to this file')
+    arg_parser.add_argument('--baseline', default=BASELINE)
+    arg_parser.add_argument(
+        '--tolerance', type=float, default=0.25, help='allowed slowdown, 0.25 is 25%%'
+    )
+    arg_parser.add_argument(
+        '--min-time', type=float, default=0.01, help='ignore phases faster than this'
+    )
+    arg_parser.add_argument(
+        '--save-baseline', action='store_true', help='store the results as the baseline'
+    )
+    args = arg_parser.parse_args(argv)
+
+    results = run(args.scales, args.repeat, args.resolver)
+    dumped = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as f:
+            f.write(dumped + '\n')
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='UTF-8') as f:
+            f.write(dumped + '\n')
+        print(dumped)
+        return 0
+
+    if not osp.exists(args.baseline):
+        print(dumped)
+        print(f'no baseline at {args.baseline}', file=sys.stderr)
+        return 0
+    with open(args.baseline, 'r', encoding='UTF-8') as f:
+        baseline = json.load(f)
+    if 'calibration' not in baseline['meta']:
+        print(
+            f'{args.baseline} has no calibration, record it again with --save-baseline',
+            file=sys.stderr,
+        )
+        return 2
+    lines, regressions = compare(results, baseline, args.tolerance, args.min_time)
+    print('\n'.join(lines))
+    if regressions:
+        print(
+            f'{len(regressions)} phase(s) slower than the baseline '
+            f'by more than {args.tolerance:.0%}',
+            file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
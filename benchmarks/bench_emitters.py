@@ -0,0 +1,86 @@
+"""Throughput of the emitters turning asts back into source code.
+
+Usage:
+    python benchmarks/bench_emitters.py                     # on a synthetic package
+    python benchmarks/bench_emitters.py --source-dir path/to/package -o result.json
+
+Every emitter generates the source of all the files, the best of `--repeat`
+runs is reported in files and bytes of generated code per second. The asts
+are not rewritten, which is the best case of the slice emitter.
+"""
+
+import argparse
+import ast
+import json
+import os.path as osp
+import shutil
+import sys
+import tempfile
+import time
+
+from synthetic import generate_project, project_files
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+
+from codeslim.codeslim import _EMITTERS, _build_emitter  # noqa: E402
+
+
+def run(files, emitters, repeat=3):
+    trees = []
+    for file in files:
+        with open(file, 'rb') as f:
+            trees.append((file, ast.parse(f.read(), file)))
+
+    results = {}
+    for name in emitters:
+        emitter = _build_emitter(name)
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            size = sum(len(emitter(tree, file)) for file, tree in trees)
+            best = min(best, time.perf_counter() - start)
+        results[name] = {
+            'seconds': best,
+            'bytes': size,
+            'files_per_second': len(trees) / best,
+            'bytes_per_second': size / best,
+        }
+    return {'files': len(trees), 'results': results}
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    arg_parser.add_argument(
+        '--source-dir', help='emit the files of this directory instead of a synthetic package'
+    )
+    arg_parser.add_argument('--files', type=int, default=200, help='size of the synthetic package')
+    arg_parser.add_argument(
+        '--emitters', nargs='+', choices=list(_EMITTERS), default=list(_EMITTERS)
+    )
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('-o', '--output', help='write the results as json to this file')
+    args = arg_parser.parse_args(argv)
+
+    root = None
+    try:
+        if args.source_dir:
+            files = project_files(args.source_dir)
+        else:
+            root = tempfile.mkdtemp(prefix='codeslim-bench-')
+            generate_project(root, files=args.files, depth=8, fanout=3, class_depth=3, file_size=20)
+            files = project_files(root)
+        results = run(files, args.emitters, args.repeat)
+    finally:
+        if root is not None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    dumped = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as f:
+            f.write(dumped + '\n')
+    print(dumped)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""Generator of synthetic python packages to benchmark CodeSlim on.
+
+The package `<name>` is made of `depth` layers of modules, layer `k` lives in the
+subpackage `<name>.l<k>` and every module of it imports `fanout` modules of layer
+`k + 1`, so every module is reachable from the entry file `main.py`.
+Each module defines a chain of `class_depth` classes, the root of which inherits
+from a class of the first imported module, plus `file_size` functions, half of
+them used and half of them dead.
+"""
+
+import os
+import os.path as osp
+from typing import Dict, List
+
+
+def _module_name(layer, index):
+    return f'l{layer}_m{index}'
+
+
+def _layer_sizes(files, depth):
+    depth = max(1, min(depth, files))
+    sizes = [files // depth] * depth
+    for i in range(files % depth):
+        sizes[i] += 1
+    return sizes
+
+
+def _imports_of(layer, index, sizes, fanout):
+    if layer + 1 >= len(sizes):
+        return []
+    size = sizes[layer + 1]
+    # spread the imports so that every module of the next layer is imported
+    targets = []
+    for i in range(min(fanout, size)):
+        target = (index * fanout + i) % size
+        if target not in targets:
+            targets.append(target)
+    return targets
+
+
+def _render_import(name, layer, target, relative, symbols):
+    module = _module_name(layer + 1, target)
+    if relative:
+        return f'from ..l{layer + 1}.{module} import {", ".join(symbols)}'
+    return f'from {name}.l{layer + 1}.{module} import {", ".join(symbols)}'
+
+
+def _render_module(name, layer, index, sizes, fanout, relative, class_depth, file_size):
+    lines = ['import os', '']
+    targets = _imports_of(layer, index, sizes, fanout)
+    for target in targets:
+        symbols = [f'C{layer + 1}_{target}', f'used_{layer + 1}_{target}_0']
+        lines.append(_render_import(name, layer, target, relative, symbols))
+    lines.append('')
+
+    base = f'C{layer + 1}_{targets[0]}' if targets else 'object'
+    for level in range(class_depth):
+        cls = f'C{layer}_{index}' if level == class_depth - 1 else f'_C{layer}_{index}_{level}'
+        lines += ['', f'class {cls}({base}):', f'    level_{level} = {level}', '']
+        lines += [f'    def method_{level}(self, x):', f'        return x + {level}', '']
+        base = cls
+
+    calls = ' + '.join(f'used_{layer + 1}_{t}_0(x)' for t in targets) or '0'
+    for i in range(max(1, file_size)):
+        # the odd functions are never used
+        prefix = 'used' if i % 2 == 0 else 'dead'
+        body = calls if i == 0 else f'used_{layer}_{index}_0(x) + {i}'
+        lines += ['', f'def {prefix}_{layer}_{index}_{i}(x):']
+        lines += [f'    y = os.path.join(str(x), "{i}")', f'    return {body} + len(y)', '']
+    return '\n'.join(lines) + '\n'
+
+
+def _render_main(name, sizes):
+    # the entry is a script, so it always uses absolute imports
+    lines = []
+    for index in range(sizes[0]):
+        module = _module_name(0, index)
+        lines.append(f'from {name}.l0.{module} import C0_{index}, used_0_{index}_0')
+    lines += ['', '', 'def main():', '    total = 0']
+    for index in range(sizes[0]):
+        lines += [f'    total += used_0_{index}_0(1)', f'    C0_{index}()']
+    lines += ['    return total', '', '', "if __name__ == '__main__':", '    main()']
+    return '\n'.join(lines) + '\n'
+
+
+def generate_project(
+    root: str,
+    files: int = 50,
+    depth: int = 5,
+    fanout: int = 2,
+    relative: bool = True,
+    class_depth: int = 2,
+    file_size: int = 10,
+    name: str = 'synth',
+) -> str:
+    """Write a synthetic package under `root` and returns the path of its entry file.
+
+    `files` is the number of modules besides the entry, `depth` the length of the
+    longest import chain, `fanout` the number of modules imported by each module,
+    `relative` whether the package uses relative imports, `class_depth` the length
+    of the class chain defined in each module and `file_size` the number of
+    functions defined in each module.
+    """
+    sizes = _layer_sizes(files, depth)
+    package = osp.join(root, name)
+    os.makedirs(package, exist_ok=True)
+    with open(osp.join(package, '__init__.py'), 'w', encoding='UTF-8'):
+        pass
+    for layer, size in enumerate(sizes):
+        layer_dir = osp.join(package, f'l{layer}')
+        os.makedirs(layer_dir, exist_ok=True)
+        with open(osp.join(layer_dir, '__init__.py'), 'w', encoding='UTF-8'):
+            pass
+        for index in range(size):
+            source = _render_module(
+                name, layer, index, sizes, fanout, relative, class_depth, file_size
+            )
+            with open(
+                osp.join(layer_dir, _module_name(layer, index) + '.py'), 'w', encoding='UTF-8'
+            ) as f:
+                f.write(source)
+
+    entry = osp.join(root, 'main.py')
+    with open(entry, 'w', encoding='UTF-8') as f:
+        f.write(_render_main(name, sizes))
+    return entry
+
+
+def project_files(root: str) -> List[str]:
+    paths = []
+    for dir_path, _, names in os.walk(root):
+        paths += [osp.join(dir_path, i) for i in names if i.endswith('.py')]
+    return sorted(paths)
+
+
+def project_size(root: str) -> Dict[str, int]:
+    paths = project_files(root)
+    return {'files': len(paths), 'bytes': sum(osp.getsize(i) for i in paths)}
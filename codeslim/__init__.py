@@ -1,28 +1,45 @@
+from .cache import ParseCache, ResolutionCache
 from .codeslim import (
     _IMPORT_CACHE,
     CODEGEN_PREFIX,
     LIST_OR_ITEM,
     REMOVE_NODE,
+    ASTBudget,
+    AstorEmitter,
     AutoSlim,
     BuiltinEndPoint,
+    CachedResolver,
     ClassEntry,
     ClassMerging,
     CodeGenerator,
     DefaultASTParser,
+    Emitter,
     EndPoint,
     EndPointManager,
     Entry,
     ExceptEndPoint,
     FileEntry,
     FileLevelCodeGenerator,
+    FileSummary,
+    GeneratedFile,
+    ImportResolver,
     InLine,
+    LazyImports,
     LocalEndPoint,
+    ModuleResolver,
     Parser,
+    PassManager,
+    Reachability,
+    RewritePass,
     Rewriter,
     SegmentCodeGenerator,
     SegmentEntry,
+    SliceEmitter,
+    StaticResolver,
+    StdlibEndPoint,
     StringEntry,
     T,
+    UnparseEmitter,
     UnusedRemoval,
     _CallNode,
     _ClassVisitor,
@@ -34,33 +51,56 @@ from .codeslim import (
     _is_file_exist,
     _PassController,
     cd,
+    mark_modified,
     parse_file,
 )
+from .output import OutputTree
+from .stats import Stats
 
 __all__ = [
+    'ASTBudget',
+    'AstorEmitter',
     'AutoSlim',
     'BuiltinEndPoint',
     'CODEGEN_PREFIX',
+    'CachedResolver',
     'ClassEntry',
     'ClassMerging',
     'CodeGenerator',
     'DefaultASTParser',
+    'Emitter',
     'EndPoint',
     'EndPointManager',
     'Entry',
     'ExceptEndPoint',
     'FileEntry',
     'FileLevelCodeGenerator',
+    'FileSummary',
+    'GeneratedFile',
+    'ImportResolver',
     'InLine',
     'LIST_OR_ITEM',
+    'LazyImports',
     'LocalEndPoint',
+    'ModuleResolver',
+    'OutputTree',
+    'ParseCache',
     'Parser',
+    'PassManager',
     'REMOVE_NODE',
+    'Reachability',
+    'ResolutionCache',
+    'RewritePass',
     'Rewriter',
     'SegmentCodeGenerator',
     'SegmentEntry',
+    'SliceEmitter',
+    'StaticResolver',
+    'Stats',
+    'StdlibEndPoint',
     'StringEntry',
     'T',
+    'UnparseEmitter',
     'UnusedRemoval',
     '_CallNode',
     '_ClassVisitor',
@@ -73,5 +113,6 @@ __all__ = [
     '_get_local_methods',
     '_is_file_exist',
     'cd',
+    'mark_modified',
     'parse_file',
 ]
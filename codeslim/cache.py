@@ -0,0 +1,234 @@
+import hashlib
+import importlib.metadata
+import json
+import os
+import os.path as osp
+import pickle
+import sys
+import tempfile
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+_CACHE_VERSION = 4
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    # write into a temporary file next to the target, so concurrent writers
+    # and readers only ever see complete files.
+    fd, tmp_path = tempfile.mkstemp(dir=osp.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def get_parser_fingerprint(parser_type: type) -> str:
+    """Hash of the ast parser type and the code it comes from.
+
+    The summaries depend on the parser, so upgrading codeslim, changing the module
+    of a custom parser or choosing another parser type changes the fingerprint.
+    """
+    digest = hashlib.sha1(f'{parser_type.__module__}.{parser_type.__qualname__}'.encode('utf-8'))
+    try:
+        digest.update(b'\0' + importlib.metadata.version('codeslim').encode('utf-8'))
+    except importlib.metadata.PackageNotFoundError:
+        pass
+    # a source checkout or a custom parser has no version of its own
+    module = sys.modules.get(parser_type.__module__)
+    path = getattr(module, '__file__', None)
+    if path:
+        try:
+            digest.update(f'\0{os.stat(path).st_mtime_ns}'.encode('utf-8'))
+        except OSError:
+            pass
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """On-disk cache of analysed files.
+
+    Every entry holds the summary of a file, i.e. what the ast parser collected
+    from it, and is keyed by (realpath, size, mtime_ns, sha1). The ast is stored
+    separately by content hash and only loaded when needed.
+    A changed mtime with the same content is still a hit. The entries of each
+    parser are kept apart, see `get_parser_fingerprint`.
+    """
+
+    def __init__(self, cache_dir: str, parser_type: Optional[type] = None) -> None:
+        tag = sys.implementation.cache_tag or 'python'
+        name = f'parse-{tag}-v{_CACHE_VERSION}'
+        if parser_type is not None:
+            name += '-' + get_parser_fingerprint(parser_type)[:16]
+        self.cache_dir = osp.join(osp.abspath(osp.expanduser(cache_dir)), name)
+        self._ast_dir = osp.join(self.cache_dir, 'ast')
+        os.makedirs(self._ast_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def _entry_path(self, real_path: str) -> str:
+        name = hashlib.sha1(real_path.encode('utf-8', 'surrogateescape')).hexdigest()
+        return osp.join(self.cache_dir, name + '.pkl')
+
+    def _ast_path(self, digest: str) -> str:
+        return osp.join(self._ast_dir, digest + '.pkl')
+
+    @staticmethod
+    def get_key(file_path: str, source: Optional[bytes] = None) -> Tuple[str, int, int, str]:
+        real_path = osp.realpath(file_path)
+        stat = os.stat(real_path)
+        if source is None:
+            with open(real_path, 'rb') as f:
+                source = f.read()
+        return real_path, stat.st_size, stat.st_mtime_ns, hashlib.sha1(source).hexdigest()
+
+    def load(self, file_path: str) -> Optional[Tuple[Any, str]]:
+        """Returns the summary and content hash of `file_path`, or None on a miss."""
+        real_path = osp.realpath(file_path)
+        entry_path = self._entry_path(real_path)
+        try:
+            stat = os.stat(real_path)
+            with open(entry_path, 'rb') as f:
+                key, summary = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError, AttributeError):
+            self.misses += 1
+            return None
+
+        if key[0] != real_path or key[1] != stat.st_size:
+            self.misses += 1
+            return None
+        if key[2] != stat.st_mtime_ns:
+            # touched, but maybe not changed
+            new_key = self.get_key(real_path)
+            if new_key[3] != key[3]:
+                self.misses += 1
+                return None
+            self._write_entry(entry_path, new_key, summary)
+        self.hits += 1
+        return summary, key[3]
+
+    def load_ast(self, digest: str):
+        with open(self._ast_path(digest), 'rb') as f:
+            return pickle.load(f)
+
+    def store(self, file_path: str, source: bytes, summary: Any, ast: Any = None) -> str:
+        """Store the summary and ast of `file_path`, returns the content hash."""
+        key = self.get_key(file_path, source)
+        if ast is not None:
+            ast_path = self._ast_path(key[3])
+            if not osp.exists(ast_path):
+                try:
+                    _atomic_write(ast_path, pickle.dumps(ast, pickle.HIGHEST_PROTOCOL))
+                except RecursionError:
+                    # too deep to pickle, it will be parsed from the source again
+                    pass
+        self._write_entry(self._entry_path(key[0]), key, summary)
+        self.stores += 1
+        return key[3]
+
+    def _write_entry(self, entry_path, key, summary):
+        _atomic_write(entry_path, pickle.dumps((key, summary), pickle.HIGHEST_PROTOCOL))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'stores': self.stores}
+
+
+_DIST_SUFFIXES = ('.dist-info', '.egg-info', '.egg-link', '.pth')
+
+
+def get_env_fingerprint(search_path: Optional[Sequence[str]] = None) -> str:
+    """Hash of the interpreter, the import path and the installed distributions.
+
+    Anything that may change where a module is found, e.g. installing, upgrading
+    or removing a package, changes the fingerprint.
+    """
+    search_path = sys.path if search_path is None else search_path
+    digest = hashlib.sha1()
+    digest.update(sys.executable.encode('utf-8', 'surrogateescape'))
+    digest.update(sys.version.encode('utf-8'))
+    for path in search_path:
+        digest.update(b'\0' + path.encode('utf-8', 'surrogateescape'))
+        try:
+            names = sorted(os.listdir(path or '.'))
+        except OSError:
+            continue
+        for name in names:
+            if not name.endswith(_DIST_SUFFIXES):
+                continue
+            try:
+                mtime = os.stat(osp.join(path or '.', name)).st_mtime_ns
+            except OSError:
+                continue
+            digest.update(f'\0{name}:{mtime}'.encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()
+
+
+class ResolutionCache:
+    """Map of module resolutions, memoized in memory and optionally persisted.
+
+    The persisted map is only reused by processes with the same environment
+    fingerprint, see `get_env_fingerprint`.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None) -> None:
+        self._memo: Dict[str, Optional[str]] = {}
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.path = None
+        if cache_dir:
+            cache_dir = osp.abspath(osp.expanduser(cache_dir))
+            os.makedirs(cache_dir, exist_ok=True)
+            self.path = osp.join(cache_dir, f'resolve-{get_env_fingerprint()}.json')
+            self._memo.update(self._load())
+            # entries of the persisted map may point to removed files.
+            self._unchecked = set(self._memo)
+        else:
+            self._unchecked = set()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='UTF-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def __contains__(self, key: str) -> bool:
+        if key not in self._memo:
+            return False
+        if key in self._unchecked:
+            self._unchecked.discard(key)
+            path = self._memo[key]
+            if path is not None and not osp.exists(path):
+                del self._memo[key]
+                return False
+        return True
+
+    def lookup(self, key: str) -> Tuple[bool, Optional[str]]:
+        """Returns whether `key` is known, and the file it was resolved to."""
+        if key in self:
+            self.hits += 1
+            return True, self._memo[key]
+        self.misses += 1
+        return False, None
+
+    def set(self, key: str, path: Optional[str]) -> None:
+        self._memo[key] = path
+        self._dirty = True
+
+    def save(self) -> None:
+        if self.path is None or not self._dirty:
+            return
+        # merge with the entries written by others in the meanwhile
+        memo = self._load()
+        memo.update(self._memo)
+        _atomic_write(self.path, json.dumps(memo, sort_keys=True).encode('UTF-8'))
+        self._dirty = False
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._memo)}
@@ -1,11 +1,27 @@
+from __future__ import annotations
+
 import ast
+import copy
+import fnmatch
+import hashlib
 import importlib
+import importlib.machinery
+import io
+import mmap
 import os
 import os.path as osp
+import pickle
+import re
 import shutil
+import sys
+import tempfile
+import time
+import tokenize
+import warnings
 from abc import ABCMeta, abstractmethod
 from ast import (
     AST,
+    AsyncFunctionDef,
     Attribute,
     Call,
     ClassDef,
@@ -18,12 +34,27 @@ from ast import (
     NodeVisitor,
     Subscript,
 )
-from collections import OrderedDict, defaultdict
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
 from enum import Enum
-from typing import Any, Callable, Dict, List, Optional, Sequence, TypeVar, Union
+from functools import partial
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    TypeVar,
+    Union,
+)
 
-import astor
-from astpretty import pprint  # for pdb debug
+from .cache import ParseCache, ResolutionCache
+from .output import OutputTree
+from .stats import NULL_STATS, Stats
 
 CODEGEN_PREFIX = '# Generated by CodeSlim\n'
 
@@ -57,11 +88,13 @@ def parse_file(filename: str):
     ext = os.path.splitext(filename)
     if ext != '.py':
         pass
-    with open(filename, 'r') as f:
+    # from bytes, so that the coding cookie of the file is honored
+    with open(filename, 'rb') as f:
         source_code = f.read()
-    return ast.parse(source_code)
+    return ast.parse(source_code, filename)
 
 
+@contextmanager
 def cd(target):
     prev = os.getcwd()
     os.chdir(os.path.expanduser(target))
@@ -71,7 +104,179 @@ def cd(target):
         os.chdir(prev)
 
 
+def mark_modified(node: AST) -> AST:
+    """Mark a node changed in place by a rewriter, see `SliceEmitter`."""
+    node.is_modified = True
+    return node
+
+
+def _is_modified(tree: AST) -> bool:
+    if getattr(tree, 'is_modified', False):
+        return True
+    return any(getattr(i, 'is_modified', False) for i in getattr(tree, 'body', ()))
+
+
+class Emitter(metaclass=ABCMeta):
+    """Turns an ast back into source code, `file_name` is the file it was parsed from."""
+
+    @abstractmethod
+    def __call__(self, tree: AST, file_name: Optional[str] = None) -> str:
+        pass
+
+
+class AstorEmitter(Emitter):
+    def __call__(self, tree, file_name=None):
+        import astor
+
+        return astor.to_source(tree)
+
+
+class UnparseEmitter(Emitter):
+    """`ast.unparse` of python 3.9+, no third party dependency."""
+
+    def __init__(self):
+        if not hasattr(ast, 'unparse'):
+            raise RuntimeError('ast.unparse requires python 3.9 or later')
+
+    def __call__(self, tree, file_name=None):
+        return ast.unparse(tree) + '\n'
+
+
+# what may be found between two statements, a comment runs to the end of its line
+# so that a run of `#` is matched in one way only
+_STMT_GAP = re.compile(rb'(?:[ \t\f\r\n;]|#[^\r\n]*(?=[\r\n]|\Z)|\\\r?\n)*')
+# the comment ending the last line of a statement
+_TRAILING_COMMENT = re.compile(rb'[ \t]*#[^\r\n]*')
+
+
+class SliceEmitter(Emitter):
+    """Copies the top level statements left untouched by the rewriters from the original file.
+
+    Only the statements marked by `mark_modified`, or holding a marked node, and the new ones
+    are emitted by `fallback`. The comments and blank lines between two statements are kept,
+    unless a statement was removed in between; the comment ending the line of a kept
+    statement is kept anyway.
+    """
+
+    def __init__(self, fallback: Union[str, Emitter, None] = None):
+        if fallback is None:
+            fallback = 'unparse' if hasattr(ast, 'unparse') else 'astor'
+        self.fallback = _build_emitter(fallback)
+
+    def __call__(self, tree, file_name=None):
+        if file_name is None or not isinstance(tree, ast.Module) or not osp.isfile(file_name):
+            return self.fallback(tree)
+        with open(file_name, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return self.fallback(tree)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+                encoding, _ = tokenize.detect_encoding(io.BytesIO(source[:4096]).readline)
+                if encoding not in ('utf-8', 'utf-8-sig'):
+                    # the column offsets are not the ones of the file
+                    return self.fallback(tree)
+                return self._emit(tree, source)
+
+    def _emit(self, tree, source):
+        base = 3 if source[:3] == b'\xef\xbb\xbf' else 0
+        line_starts = [base]
+        pos = source.find(b'\n')
+        while pos != -1:
+            line_starts.append(pos + 1)
+            pos = source.find(b'\n', pos + 1)
+
+        parts = []
+        prev_end = base
+        prev = None
+        for stmt in tree.body:
+            span = self._get_span(stmt, line_starts)
+            start, end = span if span is not None else (None, None)
+            gap = None
+            if start is not None and prev_end is not None and prev_end <= start:
+                gap = source[prev_end:start]
+            if gap is not None and _STMT_GAP.fullmatch(gap):
+                parts.append(gap.decode('utf-8'))
+            elif parts:
+                parts.append(self._trailing_comment(source, prev_end))
+                is_def = stmt.__class__ in _SCOPE_TYPES or prev.__class__ in _SCOPE_TYPES
+                parts.append('\n\n\n' if is_def else '\n')
+
+            if start is not None and not getattr(stmt, 'is_modified', False):
+                parts.append(source[start:end].decode('utf-8'))
+            else:
+                parts.append(self.fallback(stmt).rstrip('\n'))
+            prev_end = end
+            prev = stmt
+        parts.append(self._trailing_comment(source, prev_end))
+        parts.append('\n')
+        return ''.join(parts).replace('\r\n', '\n')
+
+    def _trailing_comment(self, source, end):
+        if end is None:
+            return ''
+        match = _TRAILING_COMMENT.match(source, end)
+        return match.group().decode('utf-8') if match else ''
+
+    def _get_span(self, stmt, line_starts):
+        end_lineno = getattr(stmt, 'end_lineno', None)
+        if getattr(stmt, 'lineno', None) is None or end_lineno is None:
+            return None
+        lineno, col_offset = stmt.lineno, stmt.col_offset
+        decorators = getattr(stmt, 'decorator_list', None)
+        if decorators:
+            lineno, col_offset = min(i.lineno for i in decorators), 0
+        if end_lineno > len(line_starts):
+            return None
+        return (
+            line_starts[lineno - 1] + col_offset,
+            line_starts[end_lineno - 1] + stmt.end_col_offset,
+        )
+
+
+_EMITTERS = {
+    'astor': AstorEmitter,
+    'unparse': UnparseEmitter,
+    'slice': SliceEmitter,
+}
+
+
+def _build_emitter(emitter: Union[str, Emitter, None]) -> Emitter:
+    if emitter is None:
+        emitter = 'astor'
+    if isinstance(emitter, str):
+        if emitter not in _EMITTERS:
+            raise ValueError(f'Unknown emitter: {emitter}, expected one of {list(_EMITTERS)}')
+        emitter = _EMITTERS[emitter]()
+    return emitter
+
+
+class GeneratedFile:
+    """An output yielded by `AutoSlim.iter_generate`."""
+
+    __slots__ = ('source', 'path', 'bytes_written', 'seconds')
+
+    def __init__(
+        self, source: Optional[str], path: str, bytes_written: int, seconds: float
+    ) -> None:
+        # the traced file, None for the generated __init__.py
+        self.source = source
+        self.path = path
+        # 0 if the output was already up to date
+        self.bytes_written = bytes_written
+        self.seconds = seconds
+
+    def __repr__(self) -> str:
+        return (
+            f'GeneratedFile({self.path!r}, bytes_written={self.bytes_written}, '
+            f'seconds={self.seconds:.4f})'
+        )
+
+
 class CodeGenerator:
+    stats = NULL_STATS
+    emitter: Emitter = AstorEmitter()
+    # the outputs only written when they change, None writes them all the time
+    output: Optional[OutputTree] = None
+
     def generate(self):
         raise NotImplementedError()
 
@@ -82,17 +287,18 @@ class CodeGenerator:
         pass
 
     def _generate_from_str(self, filename, contends: Optional[List[str]] = None):
-        with open(filename, 'w', encoding='UTF-8') as f:
-            f.writelines(CODEGEN_PREFIX)
-            if contends:
-                for c in contends:
-                    f.writelines(c)
+        return self._write(filename, ''.join([CODEGEN_PREFIX] + list(contends or ())))
 
     def _generate_from_ast(self, filename, ast):
-        source_code = astor.to_source(ast)
+        return self._write(filename, CODEGEN_PREFIX + self.emitter(ast))
+
+    def _write(self, filename, source_code):
+        # returns whether the file was written
+        if self.output is not None:
+            return self.output.write(filename, source_code.encode('UTF-8'))
         with open(filename, 'w', encoding='UTF-8') as f:
-            f.writelines(CODEGEN_PREFIX)
             f.write(source_code)
+        return True
 
     def generate_init(self, target_path, force=False):
         if not force and _is_file_exist(target_path, '__init__.py'):
@@ -103,10 +309,42 @@ class CodeGenerator:
     def rewrite_imports(self, ast, module_mapper):
         raise NotImplementedError()
 
-    def copy_file(self, source_file, target_dir, force=False):
+    def copy_file(self, source_file, target_dir, force=False, prefix=None):
         if not force and _is_file_exist(target_dir, osp.basename(source_file)):
             raise RuntimeError(f'{source_file} exists!')
-        shutil.copy(source_file, target_dir)
+        if prefix is None:
+            shutil.copy(source_file, target_dir)
+            return True
+        return self._copy_with_prefix(
+            source_file, osp.join(target_dir, osp.basename(source_file)), prefix
+        )
+
+    def _copy_with_prefix(self, source_file, target_path, prefix=CODEGEN_PREFIX):
+        # a hardlink or reflink can not be used since the content differs by the prefix,
+        # the rest of the file is copied by the kernel where possible.
+        with open(source_file, 'rb') as src:
+            head = src.read(4096)
+            encoding, _ = tokenize.detect_encoding(io.BytesIO(head).readline)
+            if encoding not in ('utf-8', 'utf-8-sig'):
+                # the coding cookie may not be in the first two lines after the prefix
+                return False
+            offset = 3 if encoding == 'utf-8-sig' else 0
+            prefix = prefix.encode('UTF-8')
+            size = os.fstat(src.fileno()).st_size - offset
+            if self.output is None:
+                with open(target_path, 'wb') as dst:
+                    _send_file(src, dst, prefix, offset, size)
+                return True
+            # the source is read anyway to know whether the output changed
+            src.seek(offset)
+            digest = hashlib.sha1(prefix)
+            for chunk in iter(partial(src.read, 1 << 20), b''):
+                digest.update(chunk)
+            digest = digest.hexdigest()
+            if not self.output.is_current(target_path, digest, len(prefix) + size):
+                with self.output.staged(target_path, digest) as dst:
+                    _send_file(src, dst, prefix, offset, size)
+        return True
 
     def makedirs(self, path):
         os.makedirs(path, exist_ok=True)
@@ -116,6 +354,21 @@ class CodeGenerator:
         pass
 
 
+def _send_file(src, dst, prefix, offset, size):
+    dst.write(prefix)
+    dst.flush()
+    try:
+        while size > 0:
+            sent = os.sendfile(dst.fileno(), src.fileno(), offset, size)
+            if sent == 0:
+                break
+            offset += sent
+            size -= sent
+    except (AttributeError, OSError):
+        src.seek(offset)
+        shutil.copyfileobj(src, dst)
+
+
 class Rewriter(NodeTransformer):
     def __init__(
         self,
@@ -143,6 +396,190 @@ class Rewriter(NodeTransformer):
         return node
 
 
+class RewritePass:
+    """The handlers, pre-hooks and post-hooks of one rewriting pass, as taken by `Rewriter`.
+
+    On the same node, the handlers of this pass run after the ones of the passes named in
+    `after`. The passes named in `requires` walk the whole tree before this pass starts.
+    Unless `tracks_changes`, i.e. the handlers call `mark_modified` on what they change,
+    every node returned by a handler is marked as modified.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        targets: Dict[str, Callable],
+        pre_hooks: Optional[Dict[str, Callable]] = None,
+        post_hooks: Optional[Dict[str, Callable]] = None,
+        after: Sequence[str] = (),
+        requires: Sequence[str] = (),
+        tracks_changes: bool = False,
+    ):
+        self.name = name
+        self.targets = targets
+        self.pre_hooks = pre_hooks or {}
+        self.post_hooks = post_hooks or {}
+        self.after = tuple(after)
+        self.requires = tuple(requires)
+        self.tracks_changes = tracks_changes
+
+    def __repr__(self) -> str:
+        return f'RewritePass({self.name})'
+
+
+class _FusedRewriter(NodeTransformer):
+    # runs the passes of a stage in one traversal, as if each one was a `Rewriter`:
+    # a pass handling a node type does not visit the children of those nodes.
+    def __init__(self, passes: Sequence[RewritePass]):
+        self.active = tuple(passes)
+
+    def visit(self, node):
+        passes = self.active
+        # the passes without handler for the node visit its children
+        deferred = []
+        for p in passes:
+            if not isinstance(node, AST):
+                # removed, or replaced by several nodes
+                return node
+            node_name = node.__class__.__name__
+            if node_name in p.pre_hooks:
+                p.pre_hooks[node_name](node)
+            handler = p.targets.get(node_name)
+            if handler is None:
+                deferred.append(p)
+                continue
+            node = handler(node)
+            if not p.tracks_changes and isinstance(node, AST):
+                mark_modified(node)
+            if node_name in p.post_hooks:
+                node = p.post_hooks[node_name](node)
+
+        if deferred and isinstance(node, AST):
+            node_name = node.__class__.__name__
+            self.active = tuple(deferred)
+            try:
+                node = self.generic_visit(node)
+            finally:
+                self.active = passes
+            for p in deferred:
+                if node_name in p.post_hooks:
+                    node = p.post_hooks[node_name](node)
+        return node
+
+    def generic_visit(self, node):
+        # as `NodeTransformer.generic_visit`, but marks the nodes whose children changed
+        modified = False
+        for field, old_value in ast.iter_fields(node):
+            if isinstance(old_value, list):
+                new_values = []
+                for value in old_value:
+                    if isinstance(value, AST):
+                        new_value = self.visit(value)
+                        if new_value is not value:
+                            modified = True
+                        if new_value is None:
+                            continue
+                        if not isinstance(new_value, AST):
+                            new_values.extend(new_value)
+                            continue
+                        modified = modified or getattr(new_value, 'is_modified', False)
+                        value = new_value
+                    new_values.append(value)
+                old_value[:] = new_values
+            elif isinstance(old_value, AST):
+                new_node = self.visit(old_value)
+                if new_node is not old_value:
+                    modified = True
+                if new_node is None:
+                    delattr(node, field)
+                else:
+                    modified = modified or getattr(new_node, 'is_modified', False)
+                    setattr(node, field, new_node)
+        if modified:
+            mark_modified(node)
+        return node
+
+
+class PassManager:
+    """Runs several `RewritePass` in as few traversals as possible.
+
+    Passes are fused into one traversal, unless a pass requires the results of
+    an earlier one, which starts a new traversal.
+    """
+
+    def __init__(self, passes: Sequence[RewritePass] = ()):
+        self.passes: List[RewritePass] = []
+        self._stages = None
+        for p in passes:
+            self.add(p)
+
+    def add(self, rewrite_pass: RewritePass):
+        if any(p.name == rewrite_pass.name for p in self.passes):
+            raise ValueError(f'Duplicated pass: {rewrite_pass.name}')
+        self.passes.append(rewrite_pass)
+        self._stages = None
+        return self
+
+    def schedule(self) -> List[List[RewritePass]]:
+        """The passes of each traversal, in order."""
+        if self._stages is not None:
+            return self._stages
+        by_name = {p.name: p for p in self.passes}
+        for p in self.passes:
+            for name in p.after + p.requires:
+                if name not in by_name:
+                    raise ValueError(f'{p.name} depends on unknown pass {name}')
+
+        stage = {}
+        ordered = []
+        visiting = set()
+
+        def _place(p):
+            if p.name in stage:
+                return stage[p.name]
+            if p.name in visiting:
+                raise ValueError(f'Cyclic dependency of pass {p.name}')
+            visiting.add(p.name)
+            level = 0
+            for name in p.after:
+                level = max(level, _place(by_name[name]))
+            for name in p.requires:
+                level = max(level, _place(by_name[name]) + 1)
+            visiting.discard(p.name)
+            stage[p.name] = level
+            ordered.append(p)
+            return level
+
+        for p in self.passes:
+            _place(p)
+        stages = [[] for _ in range(max(stage.values(), default=-1) + 1)]
+        for p in ordered:
+            stages[stage[p.name]].append(p)
+        self._stages = stages
+        return stages
+
+    def run(self, tree: AST) -> AST:
+        for passes in self.schedule():
+            tree = _FusedRewriter(passes).visit(tree)
+        return tree
+
+
+def _get_passes(name, rewrite_funcs, custom_rewriter, pre_hooks=None):
+    # a dict of custom handlers overrides the built-in ones, as in one `Rewriter`
+    passes = []
+    tracks_changes = True
+    if isinstance(custom_rewriter, dict):
+        rewrite_funcs.update(custom_rewriter)
+        tracks_changes = not custom_rewriter
+    elif isinstance(custom_rewriter, RewritePass):
+        passes.append(custom_rewriter)
+    elif custom_rewriter is not None:
+        passes.extend(custom_rewriter)
+    return [
+        RewritePass(name, rewrite_funcs, pre_hooks=pre_hooks, tracks_changes=tracks_changes)
+    ] + passes
+
+
 class _ClassVisitor(NodeVisitor):
     def __init__(self, cls_node):
         self.methods = {}
@@ -171,8 +608,9 @@ class ClassMerging:
 
     def _merge_methods(self, node):
         if node.name not in self.methods:
-            # astor.to_source do not use lineno, so just append it
-            self.cls_node.body.append(node)
+            # the emitters do not use lineno, so just append it. A copy, the ast of the
+            # base is rewritten later on its own, or loaded again in another worker.
+            self.cls_node.body.append(copy.deepcopy(node))
         return node
 
     def _rewrite_name(self, node):
@@ -185,8 +623,312 @@ class ClassMerging:
         for base_name, base_parser in self.base_parsers.items():
             self.cur_base = base_name
             base_node = base_parser._local_defs[base_name].node
-            self.cls_node.bases = base_node.bases
+            self.cls_node.bases = copy.deepcopy(base_node.bases)
             self.rewriter.visit(base_node)
+        mark_modified(self.cls_node)
+
+
+class _LocalNames(NodeVisitor):
+    # the names local to a function: its parameters and the names bound in its body,
+    # except the ones declared global or nonlocal. Nested scopes are not entered.
+    def __init__(self):
+        self.bound = set()
+        self.declared = set()
+
+    def run(self, node):
+        args = node.args
+        for arg in args.posonlyargs + args.args + args.kwonlyargs + [args.vararg, args.kwarg]:
+            if arg is not None:
+                self.bound.add(arg.arg)
+        body = node.body if isinstance(node.body, list) else [node.body]
+        for stmt in body:
+            self.visit(stmt)
+        return self.bound - self.declared
+
+    def visit_Name(self, node):
+        if not isinstance(node.ctx, ast.Load):
+            self.bound.add(node.id)
+
+    def visit_FunctionDef(self, node):
+        # the decorators and default values are evaluated in this scope
+        self.bound.add(node.name)
+        for i in node.decorator_list + node.args.defaults + node.args.kw_defaults:
+            if i is not None:
+                self.visit(i)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        self.bound.add(node.name)
+        for i in node.decorator_list + node.bases:
+            self.visit(i)
+
+    def visit_Lambda(self, node):
+        for i in node.args.defaults + node.args.kw_defaults:
+            if i is not None:
+                self.visit(i)
+
+    def _visit_comprehension(self, node):
+        # the targets are local to the comprehension, only `:=` binds in this scope
+        for i in ast.walk(node):
+            if isinstance(i, ast.NamedExpr):
+                self.visit(i.target)
+
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = _visit_comprehension
+
+    def visit_ExceptHandler(self, node):
+        if node.name:
+            self.bound.add(node.name)
+        self.generic_visit(node)
+
+    def _visit_import(self, node):
+        self.bound.update(_bound_names(node))
+
+    visit_Import = visit_ImportFrom = _visit_import
+
+    def _visit_declaration(self, node):
+        self.declared.update(node.names)
+
+    visit_Global = visit_Nonlocal = _visit_declaration
+
+    def visit_MatchAs(self, node):
+        if node.name:
+            self.bound.add(node.name)
+        self.generic_visit(node)
+
+    def visit_MatchStar(self, node):
+        if node.name:
+            self.bound.add(node.name)
+
+    def visit_MatchMapping(self, node):
+        if node.rest:
+            self.bound.add(node.rest)
+        self.generic_visit(node)
+
+
+class _ImportUses(NodeVisitor):
+    # where the names bound by the top level imports are used: at the module level, which
+    # includes class bodies, decorators and default values, or in the body of functions.
+    # The names bound locally by a function shadow the imported ones in its body.
+    def __init__(self, names):
+        self.names = names
+        self.module_level = set()
+        # name -> id of the outermost function using it -> (function, top level statement)
+        self.functions = defaultdict(dict)
+        self._function = None
+        self._stmt = None
+        # the local names of the enclosing functions
+        self._scopes = []
+
+    def run(self, tree):
+        for stmt in tree.body:
+            self._stmt = stmt
+            if not isinstance(stmt, (Import, ImportFrom)):
+                self.visit(stmt)
+        return self
+
+    def visit_FunctionDef(self, node):
+        # the decorators, default values and annotations are evaluated at definition time
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        self.visit(node.args)
+        if node.returns is not None:
+            self.visit(node.returns)
+        outer = self._function
+        if outer is None:
+            self._function = node
+        self._scopes.append(_LocalNames().run(node) & self.names)
+        for stmt in node.body:
+            self.visit(stmt)
+        self._scopes.pop()
+        self._function = outer
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node):
+        self.visit(node.args)
+        self._scopes.append(_LocalNames().run(node) & self.names)
+        self.visit(node.body)
+        self._scopes.pop()
+
+    def visit_Name(self, node):
+        if node.id not in self.names or any(node.id in i for i in self._scopes):
+            return
+        if self._function is None or not isinstance(node.ctx, ast.Load):
+            self.module_level.add(node.id)
+        else:
+            self.functions[node.id][id(self._function)] = (self._function, self._stmt)
+
+    def visit_Global(self, node):
+        self.module_level.update(i for i in node.names if i in self.names)
+
+    visit_Nonlocal = visit_Global
+
+    def _visit_import(self, node):
+        if self._function is None:
+            # bound again, e.g. in a `try` block
+            self.module_level.update(i for i in _bound_names(node) if i in self.names)
+
+    visit_Import = _visit_import
+    visit_ImportFrom = _visit_import
+
+
+def _bound_names(node: Union[Import, ImportFrom]):
+    if isinstance(node, Import):
+        return [i.asname or i.name.split('.')[0] for i in node.names]
+    return [i.asname or i.name for i in node.names]
+
+
+def _copy_import(node: Union[Import, ImportFrom], names):
+    names = [ast.alias(name=i.name, asname=i.asname) for i in names]
+    if isinstance(node, Import):
+        return Import(names=names)
+    return ImportFrom(module=node.module, names=names, level=node.level)
+
+
+_GETATTR_TEMPLATE = '''
+def __getattr__(name):
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+'''
+
+_GETATTR_CASE_TEMPLATE = '''
+if name == {name!r}:
+    globals()[name] = {name}
+    return {name}
+'''
+
+
+class LazyImports:
+    """Defers the top level imports of a module which are not used at the module level.
+
+    The imports move into the functions using them, and a module `__getattr__` (PEP 562)
+    imports them on first access from other modules. Only the imports of `modules` and
+    their submodules are deferred, or all of them if `modules` is None. An import used at
+    the module level is never deferred, as it runs on import of the module anyway.
+    """
+
+    def __init__(self, modules: Optional[Sequence[str]] = None):
+        self.modules = None if modules is None else tuple(modules)
+
+    def defers(self, module_name: Optional[str], level: int = 0) -> bool:
+        if self.modules is None:
+            return module_name != '__future__'
+        if level or not module_name:
+            return False
+        return any(module_name == i or module_name.startswith(i + '.') for i in self.modules)
+
+    def _get_candidates(self, tree):
+        # (statement, alias, bound name) of the top level imports which may be deferred
+        candidates = []
+        for stmt in tree.body:
+            if isinstance(stmt, Import):
+                for alias, name in zip(stmt.names, _bound_names(stmt)):
+                    if self.defers(alias.name):
+                        candidates.append((stmt, alias, name))
+            elif isinstance(stmt, ImportFrom):
+                if any(i.name == '*' for i in stmt.names) or not self.defers(
+                    stmt.module, stmt.level
+                ):
+                    continue
+                candidates.extend(
+                    (stmt, alias, name) for alias, name in zip(stmt.names, _bound_names(stmt))
+                )
+        return candidates
+
+    def rewrite(self, tree: AST) -> bool:
+        """Rewrite the module `tree` in place, returns whether an import was deferred."""
+        bound = defaultdict(int)
+        for stmt in tree.body:
+            if isinstance(stmt, (Import, ImportFrom)):
+                for name in _bound_names(stmt):
+                    bound[name] += 1
+            elif isinstance(stmt, (FunctionDef, AsyncFunctionDef, ClassDef)):
+                bound[stmt.name] += 1
+        if bound.get('__getattr__'):
+            # the module defines its own
+            return False
+        # the names bound several times are left alone
+        candidates = [i for i in self._get_candidates(tree) if bound[i[2]] == 1]
+        if not candidates:
+            return False
+        uses = _ImportUses({i[2] for i in candidates}).run(tree)
+        deferred = [i for i in candidates if i[2] not in uses.module_level]
+        if not deferred:
+            return False
+
+        local_imports = OrderedDict()
+        for stmt, alias, name in deferred:
+            for function, top in uses.functions.get(name, {}).values():
+                local_imports.setdefault(id(function), (function, top, []))[2].append((stmt, alias))
+        for function, top, aliases in local_imports.values():
+            grouped = OrderedDict()
+            for stmt, alias in aliases:
+                grouped.setdefault(id(stmt), (stmt, []))[1].append(alias)
+            imports = [_copy_import(stmt, names) for stmt, names in grouped.values()]
+            body = function.body
+            index = (
+                1
+                if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, Constant)
+                else 0
+            )
+            body[index:index] = imports
+            mark_modified(function)
+            mark_modified(top)
+
+        removed = {id(i[1]) for i in deferred}
+        body = []
+        for stmt in tree.body:
+            if isinstance(stmt, (Import, ImportFrom)) and any(id(i) in removed for i in stmt.names):
+                stmt.names = [i for i in stmt.names if id(i) not in removed]
+                if not stmt.names:
+                    continue
+                mark_modified(stmt)
+            body.append(stmt)
+        body.append(self._build_getattr(deferred))
+        tree.body[:] = body
+        mark_modified(tree)
+        return True
+
+    def _build_getattr(self, deferred):
+        func = ast.parse(_GETATTR_TEMPLATE).body[0]
+        cases = []
+        for stmt, alias, name in deferred:
+            case = ast.parse(_GETATTR_CASE_TEMPLATE.format(name=name)).body[0]
+            case.body.insert(0, _copy_import(stmt, [alias]))
+            cases.append(case)
+        func.body[0:0] = cases
+        # not in the source file
+        return mark_modified(func)
+
+
+_INIT_TEMPLATE = '''import importlib
+
+{exports}
+
+
+def __getattr__(name):
+    # the submodules are only imported on first access
+    if name in _EXPORTS:
+        module, attr = _EXPORTS[name]
+        value = getattr(importlib.import_module('.' + module, __name__), attr)
+        globals()[name] = value
+        return value
+    if name in _SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS) | _SUBMODULES)
+'''
+
+
+def _is_top_level_def(record: _DefNode) -> bool:
+    if record.def_type == _DefType.Method:
+        return False
+    node = record._node
+    col_offset = node[1] if isinstance(node, tuple) else node.col_offset
+    return col_offset == 0
 
 
 class UnusedRemoval:
@@ -198,16 +940,49 @@ class InLine:
 
 
 class FileLevelCodeGenerator(CodeGenerator):
+    # the output of a file only depends on its own analysis, so it can be generated
+    # before the files it imports are traced
+    standalone = True
+
     def __init__(
         self,
         target_dir: str,
         parser: Parser,
         # TODO(Asthestarsfalll): Support customize file structure
         module_mapper: Optional[Dict[str, str]] = None,
-        custom_rewriter: Optional[Dict[str, Callable]] = None,
+        # handlers overriding the built-in ones, or passes run along with them
+        custom_rewriter: Union[
+            Dict[str, Callable], RewritePass, Sequence[RewritePass], None
+        ] = None,
         class_merge_level: Optional[int] = None,
+        # 'astor', 'unparse', 'slice' or an `Emitter`
+        emitter: Union[str, Emitter, None] = None,
+        # copy the files left untouched by the rewriters instead of emitting them
+        copy_through: bool = True,
+        # generate the files in a process pool
+        jobs: int = 1,
+        # defer the imports which are only used in function bodies
+        lazy_imports: bool = False,
+        # only defer the imports of these modules and their submodules, unless `lazy_imports`,
+        # still not the ones used at the module level
+        heavy_modules: Sequence[str] = (),
+        # generate an __init__.py lazily re-exporting the kept public names, the generated
+        # modules then import each other relatively
+        package_init: bool = False,
     ):
         self.target_dir = target_dir
+        self.output = OutputTree(target_dir)
+        self.emitter = _build_emitter(emitter)
+        self.copy_through = copy_through
+        self.jobs = jobs
+        self.package_init = package_init
+        self.lazy_imports = None
+        if lazy_imports or heavy_modules:
+            self.lazy_imports = LazyImports(None if lazy_imports else heavy_modules)
+        self._custom_rewriter = custom_rewriter
+        self._has_custom_rewriter = bool(custom_rewriter)
+        self._parser = parser
+        self._follow_imports()
         self.parsers = parser.get_parsers()
         self.module_mapper = module_mapper or {}
         if self.__class__.__name__ == 'FileLevelCodeGenerator' and class_merge_level is not None:
@@ -219,15 +994,52 @@ class FileLevelCodeGenerator(CodeGenerator):
         self.rewriter = self._build_rewriter(custom_rewriter)
         self.imports_info = self._get_imports_info(parser.relations)
         self.relation = parser.relations
+        self.stats = parser.stats
+        self.budget = parser.budget
+
+    def __getstate__(self):
+        # sent to the workers of `generate`, the rewriter holds bound methods of self
+        state = self.__dict__.copy()
+        del state['rewriter']
+        del state['_parser']
+        state['stats'] = NULL_STATS
+        state['budget'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.rewriter = self._build_rewriter(self._custom_rewriter)
 
     def _build_rewriter(self, custom_rewriter):
         rewrite_funcs = {
             'Import': self.rewrite_imports,
             'ImportFrom': self.rewrite_imports,
         }
-        if custom_rewriter is not None:
-            rewrite_funcs.update(custom_rewriter)
-        return Rewriter(rewrite_funcs)
+        return self._build_pass_manager(_get_passes('imports', rewrite_funcs, custom_rewriter))
+
+    def _build_pass_manager(self, passes):
+        if self.lazy_imports is not None:
+            # the uses are known once the other passes have rewritten the whole tree
+            requires = [p.name for p in passes]
+            lazy = RewritePass(
+                'lazy_imports',
+                {'Module': self._rewrite_lazy_imports},
+                requires=requires,
+                tracks_changes=True,
+            )
+            passes.append(lazy)
+        return PassManager(passes)
+
+    def _follow_imports(self):
+        # whole files are generated, the symbol trace may have left out the modules they import.
+        # Returns the newly traced files.
+        if self._parser.trace != 'symbol':
+            return []
+        return self._parser.follow_imports()
+
+    def _rewrite_lazy_imports(self, node):
+        self.lazy_imports.rewrite(node)
+        return node
 
     def _get_imports_info(self, relation):
         extra_info = defaultdict(list)
@@ -238,32 +1050,333 @@ class FileLevelCodeGenerator(CodeGenerator):
 
     def generate(self):
         self.makedirs(self.target_dir)
-        with cd(self.target_dir):
-            for file, parser in self.parsers.items():
-                file_name = osp.basename(parser.file_name)
-                # TODO(Asthestarsfalll): need to process __init__ file
-                if file_name == '__init__.py':
+        self._generate_files(list(self.parsers))
+        if self.package_init:
+            self._generate_package_init()
+        # the outputs of files no longer traced
+        self.output.prune()
+        self.output.save()
+
+    def _generate_package_init(self):
+        # returns the path of the __init__.py, None if it is kept as it is
+        path = osp.join(self.target_dir, '__init__.py')
+        if osp.exists(path) and self.output.entry(path) is None:
+            warnings.warn(f'{path} is not generated by CodeSlim, keep it.')
+            return None
+        modules, exports = self._get_exports()
+        lines = ['_EXPORTS = {']
+        lines += [
+            f'    {name!r}: ({module!r}, {attr!r}),'
+            for name, (module, attr) in sorted(exports.items())
+        ]
+        lines.append('}')
+        submodules = sorted(set(modules.values()))
+        if submodules:
+            lines += ['_SUBMODULES = {'] + [f'    {module!r},' for module in submodules] + ['}']
+        else:
+            lines.append('_SUBMODULES = set()')
+        self._generate_from_str(path, [_INIT_TEMPLATE.format(exports='\n'.join(lines))])
+        return path
+
+    def _get_exports(self):
+        # the generated modules, and the names re-exported by the package: the ones
+        # re-exported by the original packages first, then the public definitions.
+        # the entries are scripts, not part of the api of the package
+        entries = set(self._parser._entries)
+        modules = {
+            file: _get_file_name(file)
+            for file in self.parsers
+            if osp.basename(file) != '__init__.py' and file not in entries
+        }
+        exports = {}
+        for file, parser in self.parsers.items():
+            if file in modules:
+                continue
+            for name, record in parser._imports.items():
+                if name.startswith('_') or not record.is_import_from or not record.module:
                     continue
+                target = self._resolve_import(file, record)
+                if target in modules and self._is_exported(target, record.source_name):
+                    exports.setdefault(name, (modules[target], record.source_name))
+        for file, module in modules.items():
+            for name, record in self.parsers[file]._local_defs.items():
+                if (
+                    not name.startswith('_')
+                    and _is_top_level_def(record)
+                    and self._is_kept(file, name)
+                ):
+                    exports.setdefault(name, (module, name))
+        return modules, exports
+
+    def _resolve_import(self, file, record):
+        # the file imported by `record` of `file`, resolved as it was traced
+        parser = self._parser
+        return record._parse_module(parser.endpoints, parser.resolver, osp.dirname(file))
+
+    def _is_exported(self, file, name):
+        record = self.parsers[file]._local_defs.get(name)
+        if record is not None and _is_top_level_def(record):
+            return self._is_kept(file, name)
+        # the module level statements are always kept
+        return True
+
+    def _is_kept(self, file, name):
+        # whether the top level definition `name` of `file` is in its output
+        return True
+
+    def _generate_files(self, files):
+        # the output of a file only depends on the summaries of the others and its own ast,
+        # so the files are generated independently. Returns the paths written, in order.
+        if self.jobs > 1 and len(files) > 1:
+            written = self._generate_in_pool(files)
+        else:
+            written = [self._generate_file(file, self.parsers[file]) for file in files]
+        return [i for i in written if i is not None]
+
+    def _generate_in_pool(self, files):
+        stats = self.stats
+        # the shared state is sent once to each worker, which loads the asts on its own
+        chunksize = max(1, len(files) // (self.jobs * 4))
+        with ProcessPoolExecutor(
+            self.jobs, initializer=_init_codegen_worker, initargs=(self, stats.enabled)
+        ) as pool:
+            results = list(pool.map(_generate_in_worker, files, chunksize=chunksize))
+        written = []
+        for file, (target_path, entry, changed, profiled) in zip(files, results):
+            if entry is not None:
+                self.output.add(target_path, entry, changed)
+            if profiled is not None:
+                phases, counters = profiled
+                for name, (wall, cpu, _) in phases.items():
+                    stats.add(name, wall, cpu, file)
+                stats.counters.update(counters)
+            written.append(target_path)
+        # as in a serial run, the asts of the generated files are not kept
+        for file in files:
+            self.parsers[file].release()
+        return written
+
+    def _iter_generate(self, files):
+        # generates `files` one by one in this process, yields a `GeneratedFile` for each output
+        for file in files:
+            parser = self.parsers[file]
+            start = time.perf_counter()
+            writes = self.output.writes
+            target_path = self._generate_file(file, parser)
+            # copied outputs never release the ast
+            parser.release()
+            if target_path is not None:
+                yield self._generated(file, target_path, writes, start)
+
+    def _generated(self, source, target_path, writes, start):
+        size = osp.getsize(target_path) if self.output.writes > writes else 0
+        return GeneratedFile(source, target_path, size, time.perf_counter() - start)
+
+    def _get_target_path(self, file):
+        return osp.join(self.target_dir, osp.basename(file))
+
+    def _generate_file(self, file, parser):
+        file_name = osp.basename(parser.file_name)
+        # TODO(Asthestarsfalll): need to process __init__ file
+        if file_name == '__init__.py':
+            return None
+        stats = self.stats
+        target_path = self._get_target_path(parser.file_name)
+        if self.copy_through and not self._needs_rewrite(parser):
+            # known from the summary, the ast is not even loaded
+            if self._copy_source(file, parser, target_path):
+                return target_path
+
+        with self._hold(parser):
+            with stats.phase('load', file):
+                tree = parser.ast
+            with stats.phase('rewrite', file):
                 self._preprocess(file, parser)
-                self.rewriter.visit(parser.ast)
+                self.rewriter.run(tree)
                 self._postprocess()
-                self._generate_from_ast(file_name, parser.ast)
+            if not (
+                self.copy_through
+                and not _is_modified(tree)
+                and self._copy_source(file, parser, target_path)
+            ):
+                with stats.phase('emit', file):
+                    source_code = self.emitter(tree, parser.file_name)
+                with stats.phase('write', file):
+                    written = self._generate_from_str(target_path, [source_code])
+                if stats.enabled:
+                    self._count_output(target_path, written, 'files_written')
+            # the ast has been rewritten in place
+            parser.release()
+        return target_path
+
+    def _hold(self, parser):
+        # the ast being rewritten is not spilled
+        return self.budget.hold(parser) if self.budget is not None else nullcontext()
+
+    def _copy_source(self, file, parser, target_path):
+        writes = self.output.writes
+        with self.stats.phase('write', file):
+            copied = self._copy_with_prefix(parser.file_name, target_path)
+        if copied and self.stats.enabled:
+            self._count_output(target_path, self.output.writes > writes, 'files_copied')
+        return copied
+
+    def _count_output(self, target_path, written, counter):
+        if written:
+            self.stats.count(counter)
+            self.stats.count('bytes_written', osp.getsize(target_path))
+        else:
+            self.stats.count('files_unchanged')
+
+    def _needs_rewrite(self, parser):
+        # whether `rewrite_imports` would change an import of the file
+        if self._has_custom_rewriter:
+            return True
+        if self.lazy_imports is not None:
+            for record in parser._imports.values():
+                if self.lazy_imports.defers(record.module, record.level):
+                    return True
+        for record in parser._get_records():
+            if not isinstance(record, _ImportNode) or not record.is_target:
+                continue
+            if not record.is_import_from:
+                if record.alias_name and (
+                    self.package_init or self._get_module_name(record.module) != record.module
+                ):
+                    return True
+                continue
+            if self.package_init:
+                # imported relatively in the package
+                return True
+            if not record.module:
+                continue
+            module_name = self.module_mapper.get(record.module)
+            if module_name is None and (record.level or '.' in record.module):
+                return True
+            if module_name is not None and module_name != record.module:
+                return True
+        return False
+
+    def _get_affected(self, files, neighbors):
+        # the output of a file only depends on the file itself
+        return files
+
+    def update(
+        self, files: Sequence[str], removed: Sequence[str] = (), neighbors: Sequence[str] = ()
+    ):
+        """Generate the outputs depending on the `files` analyzed again by `Parser.update`.
+
+        `neighbors` are the files related to `files` before the change.
+        Returns the paths written.
+        """
+        traced = self._follow_imports()
+        if traced:
+            files = list(files) + traced
+            removed = [i for i in removed if i not in self.parsers]
+        self.imports_info = self._get_imports_info(self.relation)
+        for file in removed:
+            self.output.remove(self._get_target_path(file))
+        if self.merge_level:
+            for file in files:
+                self.parsers[file].get_target_merge_class()
+
+        self.makedirs(self.target_dir)
+        written = self._generate_files(
+            [i for i in self._get_affected(files, neighbors) if i in self.parsers]
+        )
+        if self.package_init:
+            self._generate_package_init()
+        self.output.save()
+        return written
 
     def rewrite_imports(self, node: Union[ImportFrom, Import]) -> AST:
-        if isinstance(node, ImportFrom) and hasattr(node, 'is_target'):
+        # the generated modules import each other relatively in a package, absolutely otherwise
+        level = 1 if self.package_init else 0
+        if isinstance(node, ImportFrom) and hasattr(node, 'is_target') and node.module:
             module_name = node.module
             if module_name in self.module_mapper:
                 module_name = self.module_mapper[module_name]
             else:
                 # FIXME(Asthestarsfalll): need automatically get the file where the imported module belongs to
                 module_name = module_name.split('.')[-1]
-                node.level = 0
-            node.module = module_name
+                if node.level != level:
+                    node.level = level
+                    mark_modified(node)
+            if node.module != module_name:
+                node.module = module_name
+                mark_modified(node)
+            if self.package_init and node.level != level:
+                node.level = level
+                mark_modified(node)
+        elif isinstance(node, ImportFrom) and hasattr(node, 'is_target'):
+            # `from .. import a`, the generated modules are siblings
+            if self.package_init and node.level != level:
+                node.level = level
+                mark_modified(node)
+        elif isinstance(node, Import) and hasattr(node, 'target_names'):
+            relative = []
+            for alias in node.names:
+                # `import a.b as c` becomes `import b as c`, `import a.b` binds `a` and is kept
+                if alias.asname and alias.asname in node.target_names:
+                    module_name = self._get_module_name(alias.name)
+                    if module_name != alias.name:
+                        alias.name = module_name
+                        mark_modified(node)
+                    if self.package_init:
+                        if alias.asname == alias.name:
+                            alias.asname = None
+                        relative.append(alias)
+            if relative:
+                # `from . import b as c`
+                names = [i for i in node.names if i not in relative]
+                new_node = ast.copy_location(ImportFrom(None, relative, level), node)
+                mark_modified(new_node)
+                if not names:
+                    return new_node
+                node.names = names
+                mark_modified(node)
+                return [node, new_node]
 
         return node
 
+    def _get_module_name(self, module):
+        # the name of the generated module of an imported one
+        if module in self.module_mapper:
+            return self.module_mapper[module]
+        return module.split('.')[-1]
+
 
 class SegmentCodeGenerator(FileLevelCodeGenerator):
+    # the kept definitions are only known once the whole import graph is traced
+    standalone = False
+
+    def __init__(self, target_dir: str, parser: Parser, *args, **kwargs):
+        super().__init__(target_dir, parser, *args, **kwargs)
+        # the definitions which are not reachable from the entries are removed
+        self.reachability = parser.get_reachability()
+
+    def update(
+        self, files: Sequence[str], removed: Sequence[str] = (), neighbors: Sequence[str] = ()
+    ):
+        live = self.reachability.live
+        self.reachability = self._parser.get_reachability()
+        # a change may kill or revive definitions anywhere
+        revived = [i for i in self.parsers if live.get(i) != self.reachability.live.get(i)]
+        return super().update(files, removed, list(neighbors) + revived)
+
+    def _needs_rewrite(self, parser):
+        # the unused definitions are only known once the file is rewritten
+        return True
+
+    def _get_affected(self, files, neighbors):
+        # which definitions are kept depends on the importers and the imported files
+        affected = OrderedDict.fromkeys(files)
+        for file in files:
+            affected.update(OrderedDict.fromkeys(self.relation.get(file, ())))
+            affected.update(OrderedDict.fromkeys(self.imports_info.get(file, ())))
+        affected.update(OrderedDict.fromkeys(neighbors))
+        return list(affected)
+
     def _build_rewriter(self, custom_rewriter):
         rewrite_funcs = {
             'Import': self.rewrite_imports,
@@ -271,76 +1384,116 @@ class SegmentCodeGenerator(FileLevelCodeGenerator):
             'FunctionDef': self.rewrite_defs,
             'ClassDef': self.rewrite_defs,
         }
-        if custom_rewriter is not None:
-            rewrite_funcs.update(custom_rewriter)
         pre_hooks = {'ClassDef': self._classdef_hook}
-        return Rewriter(rewrite_funcs, pre_hooks=pre_hooks)
+        passes = _get_passes('segment', rewrite_funcs, custom_rewriter, pre_hooks)
+        # the merged bases are known before the walk, so their imports are removed in the same one
+        class_imports = {
+            'ImportFrom': self._rewrite_class_imports,
+            'Import': self._rewrite_class_imports,
+        }
+        passes.append(
+            RewritePass('class_imports', class_imports, after=('segment',), tracks_changes=True)
+        )
+        return self._build_pass_manager(passes)
 
     def _classdef_hook(self, node: ClassDef):
         if node.name not in self.class_merge_info:
             return node
         info = self.class_merge_info[node.name]
         rewrite_parsers = {k: self.parsers[info[k]] for k in info}
-        self.base_parsers = rewrite_parsers
         ClassMerging(self.cur_parser, rewrite_parsers, node.name).merge()
         return REMOVE_NODE
 
-    def _analyze_local_calls(self, parser):
-        calls = parser._calls
-        defs = parser._local_defs
-        local_used = []
-        # TODO(Asthestarsfalll): reduce the size of calls
-        if calls and defs:
-            # TODO(Asthestarsfalll): need more logic to tackle complex situation.
-            for name, call in calls.items():
-                if name in defs:
-                    local_used.append(name)
-        return local_used
+    def _follow_imports(self):
+        # the imports which are not referred to by the live code are removed
+        return []
 
     def _rewrite_class_imports(self, node):
-        # FIXME
+        # only the bases imported by name are merged, `import module` is kept
         if isinstance(node, ImportFrom):
             name = node.names[0].asname or node.names[0].name
             if name in self.base_parsers:
                 return REMOVE_NODE
-        else:
-            raise NotImplemented
         return node
 
     def _preprocess(self, file, parser):
         merge_class = parser._to_merge_classes
         target_files = defaultdict(OrderedDict)
 
-        for path in self.relation[file]:
-            p = self.parsers[path]
-            for m, bases in merge_class.items():
-                for base in bases:
-                    if base in p._local_defs:
-                        target_files[m][base] = path
-
-        extern_uesd = []
-        for i in self.imports_info[file]:
-            p = self.parsers[i]
-            extern_uesd += p.get_target_import_names()
-        self.extern_used = extern_uesd
-        self.local_used = self._analyze_local_calls(parser)
+        if merge_class:
+            for path in self.relation.get(file, ()):
+                defs = self.parsers[path]._local_defs if path in self.parsers else {}
+                for m, bases in merge_class.items():
+                    for base in bases:
+                        if base in defs:
+                            target_files[m][base] = path
+
         self.class_merge_info = target_files
+        # the bases merged into the classes of the file
+        self.base_parsers = {
+            base: self.parsers[path]
+            for info in target_files.values()
+            for base, path in info.items()
+        }
+        self.cur_file = file
         self.cur_parser = parser
 
-    def _postprocess(self):
-        rewriter = Rewriter(
-            {
-                'ImportFrom': self._rewrite_class_imports,
-                'Import': self._rewrite_class_imports,
-            }
-        )
-        rewriter.visit(self.cur_parser.ast)
-
     def rewrite_defs(self, node: Union[FunctionDef, ClassDef]):
-        if node.name not in self.extern_used and node.name not in self.local_used:
+        if not self.reachability.is_live(self.cur_file, node.name):
             return REMOVE_NODE
         return node
 
+    def rewrite_imports(self, node: Union[ImportFrom, Import]) -> AST:
+        # the traced modules imported but not referred to by the live code may not be generated
+        if self.cur_file in self.reachability.live:
+            names = [i for i in node.names if self._is_referenced(node, i)]
+            if not names:
+                return REMOVE_NODE
+            if len(names) != len(node.names):
+                node.names = names
+                mark_modified(node)
+        return super().rewrite_imports(node)
+
+    def _is_referenced(self, node, alias):
+        record = self.cur_parser._imports.get(alias.asname or alias.name)
+        if record is None or not record.is_target:
+            # `*`, or not a traced module
+            return True
+        name = alias.asname or alias.name
+        if isinstance(node, Import) and not alias.asname:
+            # `import a.b` binds `a`
+            name = name.partition('.')[0]
+        return self.reachability.is_referenced(self.cur_file, name)
+
+    def _is_kept(self, file, name):
+        return self.reachability.is_live(file, name)
+
+
+_worker_codegen: Optional[FileLevelCodeGenerator] = None
+_worker_profile = False
+
+
+def _init_codegen_worker(codegen, profile):
+    global _worker_codegen, _worker_profile
+    _worker_codegen = codegen
+    _worker_profile = profile
+
+
+def _generate_in_worker(file):
+    # runs in the workers of `FileLevelCodeGenerator.generate`, only the timings are sent back
+    codegen = _worker_codegen
+    codegen.stats = Stats() if _worker_profile else NULL_STATS
+    writes = codegen.output.writes
+    target_path = codegen._generate_file(file, codegen.parsers[file])
+    entry = codegen.output.entry(target_path) if target_path is not None else None
+    stats = codegen.stats
+    return (
+        target_path,
+        entry,
+        codegen.output.writes > writes,
+        (stats.phases, stats.counters) if stats.enabled else None,
+    )
+
 
 class EndPoint(metaclass=ABCMeta):
     __target__ = ['file_path']
@@ -352,11 +1505,100 @@ class EndPoint(metaclass=ABCMeta):
 
 
 class BuiltinEndPoint(EndPoint):
+    # decided by the module name alone, before the module is resolved
+    __target__ = ['module_name']
+
     def __init__(self):
-        self.builtins = list(globals()['__builtins__'].keys())
+        self.builtins = frozenset(sys.builtin_module_names)
 
     def __call__(self, module_name):
-        return module_name in self.builtins
+        return bool(module_name) and module_name.partition('.')[0] in self.builtins
+
+
+class StdlibEndPoint(BuiltinEndPoint):
+    """Stop at the modules of the standard library and the builtin ones.
+
+    Only the top level name is looked up, so the stdlib imports are never
+    resolved. `excepts` are the names shadowed by local modules, which are
+    resolved as usual.
+    """
+
+    def __init__(self, excepts=()):
+        super().__init__()
+        if isinstance(excepts, str):
+            excepts = [excepts]
+        self.excepts = frozenset(excepts)
+        self.builtins = (
+            self.builtins | frozenset(getattr(sys, 'stdlib_module_names', ()))
+        ) - self.excepts
+
+
+def _list_modules(dir):
+    # the names of the modules and packages in `dir`
+    try:
+        names = os.listdir(dir)
+    except OSError:
+        return []
+    return [osp.splitext(i)[0] for i in names if i.endswith('.py') or osp.isdir(osp.join(dir, i))]
+
+
+def _split_path(path):
+    return [i for i in os.path.abspath(path).split(os.sep) if i]
+
+
+class _PathTrie:
+    # values stored by directory, found by the paths under it
+    def __init__(self):
+        self.root = {}
+
+    def add(self, path, value):
+        node = self.root
+        for part in _split_path(path):
+            node = node.setdefault(part, {})
+        node.setdefault(None, []).append(value)
+
+    def find(self, path):
+        node = self.root
+        found = list(node.get(None, ()))
+        for part in _split_path(path):
+            node = node.get(part)
+            if node is None:
+                break
+            found.extend(node.get(None, ()))
+        return found
+
+
+class _NamePatterns:
+    # module names, `a.*` matching the submodules of `a`, and glob patterns such as `a*.b`
+    def __init__(self, patterns):
+        self.names = set()
+        self.packages = set()
+        globs = []
+        for pattern in patterns:
+            if pattern.endswith('.*') and not _has_magic(pattern[:-2]):
+                self.packages.add(pattern[:-2])
+            elif _has_magic(pattern):
+                globs.append(fnmatch.translate(pattern))
+            else:
+                self.names.add(pattern)
+        self.regex = re.compile('|'.join(globs)) if globs else None
+
+    def __contains__(self, name):
+        if not name:
+            return False
+        if name in self.names:
+            return True
+        if self.packages:
+            i = name.rfind('.')
+            while i > 0:
+                if name[:i] in self.packages:
+                    return True
+                i = name.rfind('.', 0, i)
+        return self.regex is not None and self.regex.match(name) is not None
+
+
+def _has_magic(pattern):
+    return any(i in pattern for i in '*?[')
 
 
 class LocalEndPoint(EndPoint):
@@ -364,8 +1606,9 @@ class LocalEndPoint(EndPoint):
         self.local_dir = os.path.dirname(os.path.abspath(local_dir))
 
     def __call__(self, file_path):
-        file_abs_path = os.path.abspath(file_path)
-        return os.path.commonprefix([file_abs_path, self.local_dir]) != self.local_dir
+        # outside of the directory
+        parts = _split_path(self.local_dir)
+        return _split_path(file_path)[: len(parts)] != parts
 
 
 class ExceptEndPoint(LocalEndPoint):
@@ -374,11 +1617,13 @@ class ExceptEndPoint(LocalEndPoint):
     def __init__(self, local_dir, excepts):
         if isinstance(excepts, str):
             excepts = [excepts]
+        # module names, or patterns such as `torch.*`
         self.excepts = excepts
+        self._patterns = _NamePatterns(excepts)
         super().__init__(local_dir)
 
     def __call__(self, file_path, module_name):
-        if module_name in self.excepts:
+        if module_name in self._patterns:
             return False
         else:
             return super().__call__(file_path)
@@ -395,6 +1640,7 @@ class EndPointManager:
             if pair[0] in endpoint_types and pair[1] in endpoint_types:
                 raise ValueError(f'Imcompatible endpoints: {pair}')
         self.endpoints = endpoints
+        self._matcher = None
 
     @classmethod
     def add_imcompatible_pair(cls, pair):
@@ -402,12 +1648,92 @@ class EndPointManager:
         cls.INCOMPATIBLE.append(pair)
 
     def check(self, local):
-        for endpoint in self.endpoints:
-            kwargs = {k: local[k] for k in endpoint.__target__}
-            if endpoint(**kwargs):
+        return self._get_matcher()(local)
+
+    def check_module(self, module_name):
+        """Whether the endpoints stop at `module_name` before it is resolved,
+        only the endpoints targeting the module name alone are consulted."""
+        return self._get_matcher().check_module(module_name)
+
+    def _get_matcher(self):
+        matcher = self._matcher
+        if matcher is None or matcher.endpoints != tuple(self.endpoints):
+            # compiled again if the endpoints were changed
+            matcher = self._matcher = _EndPointMatcher(self.endpoints)
+        return matcher
+
+
+class _EndPointMatcher:
+    """The endpoints compiled into one decision, memoized by (file_path, module_name).
+
+    The directories of the local and except endpoints are looked up at once in a
+    trie of path components, the except modules in sets. The other endpoints are
+    called as they are, and are not memoized if they depend on more than the file
+    path and module name. Those depending on the module name alone are also
+    checked by `check_module`, before the module is resolved.
+    """
+
+    def __init__(self, endpoints):
+        self.endpoints = tuple(endpoints)
+        self.trie = _PathTrie()
+        self.locals = []
+        self.excepts = []
+        self.others = []
+        self.volatile = []
+        for i, endpoint in enumerate(self.endpoints):
+            call = type(endpoint).__call__
+            if call is LocalEndPoint.__call__:
+                self.trie.add(endpoint.local_dir, i)
+                self.locals.append(i)
+            elif call is ExceptEndPoint.__call__:
+                self.trie.add(endpoint.local_dir, i)
+                self.excepts.append((i, endpoint._patterns))
+            elif set(endpoint.__target__) <= {'file_path', 'module_name'}:
+                self.others.append(endpoint)
+            else:
+                self.volatile.append(endpoint)
+        self.modules = [i for i in self.others if list(i.__target__) == ['module_name']]
+        self.memo = {}
+        self._module_memo = {}
+        # file_path -> the local and except endpoints whose directory holds it
+        self._holders = {}
+
+    def __call__(self, local):
+        key = (local['file_path'], local.get('module_name'))
+        stop = self.memo.get(key)
+        if stop is None:
+            stop = self.memo[key] = self._decide(*key)
+        if stop:
+            return True
+        for endpoint in self.volatile:
+            if endpoint(**{k: local[k] for k in endpoint.__target__}):
                 return True
         return False
 
+    def check_module(self, module_name):
+        stop = self._module_memo.get(module_name)
+        if stop is None:
+            stop = self._module_memo[module_name] = any(
+                i(module_name=module_name) for i in self.modules
+            )
+        return stop
+
+    def _decide(self, file_path, module_name):
+        if self.locals or self.excepts:
+            holders = self._holders.get(file_path)
+            if holders is None:
+                holders = self._holders[file_path] = frozenset(self.trie.find(file_path))
+            for i in self.locals:
+                if i not in holders:
+                    return True
+            for i, patterns in self.excepts:
+                if i not in holders and module_name not in patterns:
+                    return True
+        local = {'file_path': file_path, 'module_name': module_name}
+        return any(
+            endpoint(**{k: local[k] for k in endpoint.__target__}) for endpoint in self.others
+        )
+
 
 class Entry(metaclass=ABCMeta):
     @classmethod
@@ -431,7 +1757,14 @@ class FileEntry(Entry):
     def __init__(self, entry_files: Union[str, Sequence[str]]) -> None:
         entries = [entry_files] if isinstance(entry_files, str) else entry_files
         self.entries = [os.path.abspath(i) for i in entries]
-        self.asts = self.convert_to_ast(self.entries)
+        self._asts = None
+
+    # files are parsed on demand, the parser may load them from cache instead.
+    @property
+    def asts(self):
+        if self._asts is None:
+            self._asts = self.convert_to_ast(self.entries)
+        return self._asts
 
     def convert_to_ast(self, entries):
         return [parse_file(f) for f in entries]
@@ -457,41 +1790,331 @@ class ClassEntry(SegmentEntry):
         pass
 
 
-class _ImportNode:
+def _get_anchor_dir(base_dir, level):
+    anchor = base_dir
+    for _ in range(level - 1):
+        anchor = osp.dirname(anchor)
+    return anchor
+
+
+class ModuleResolver(metaclass=ABCMeta):
+    """Map an imported module to the file it is loaded from.
+
+    `base_dir` is the directory of the importing file, it anchors relative
+    imports (`level` > 0) and stands for the current directory otherwise.
+    Returns None for modules without a file, e.g. builtin or namespace ones.
+    """
+
+    @abstractmethod
+    def __call__(self, module_name: Optional[str], level: int = 0, base_dir: Optional[str] = None):
+        pass
+
+    def _fallback(self, module_name, level, base_dir):
+        # just a workaround for relative import
+        # should find some other methods.
+        anchor = _get_anchor_dir(base_dir or os.getcwd(), level)
+        if module_name:
+            file_path = osp.join(anchor, module_name.replace('.', os.sep) + '.py')
+        else:
+            file_path = osp.join(anchor, '__init__.py')
+        if not osp.exists(file_path):
+            raise RuntimeError(f'Cannot import module {module_name}')
+        return file_path
+
+
+class ImportResolver(ModuleResolver):
+    """Resolve modules by importing them, which executes the imported code."""
+
+    def __init__(self):
+        # relative imports and the modules next to the importing file are searched
+        # on the file system, so the result does not depend on the current directory.
+        self._local = StaticResolver(search_path=[])
+
+    def __call__(self, module_name, level=0, base_dir=None):
+        if level or not module_name:
+            return self._local(module_name, level, base_dir)
+        if '' in sys.path and base_dir is not None:
+            file_path = self._local._find([base_dir], module_name.split('.'))
+            if file_path is not False:
+                return file_path
+        try:
+            imported_module = importlib.import_module(module_name)
+            assert imported_module is not None
+            return getattr(imported_module, '__file__', None)
+        except ModuleNotFoundError:
+            return self._fallback(module_name, level, base_dir)
+
+
+class StaticResolver(ModuleResolver):
+    """Resolve modules by searching the import path like `importlib.util.find_spec`,
+    without importing anything.
+
+    Directory listings are cached, so a resolution usually costs a stat call or two.
+    """
+
+    _SUFFIXES = (
+        importlib.machinery.EXTENSION_SUFFIXES
+        + importlib.machinery.SOURCE_SUFFIXES
+        + importlib.machinery.BYTECODE_SUFFIXES
+    )
+
+    def __init__(self, search_path: Optional[List[str]] = None):
+        self.search_path = search_path
+        self._listings: Dict[str, frozenset] = {}
+
+    def __call__(self, module_name, level=0, base_dir=None):
+        base_dir = base_dir or os.getcwd()
+        if level:
+            parts = module_name.split('.') if module_name else []
+            file_path = self._find([_get_anchor_dir(base_dir, level)], parts)
+            if file_path is False:
+                return self._fallback(module_name, level, base_dir)
+            return file_path
+
+        # modules which are already imported cost nothing, it also covers aliases like `os.path`
+        module = sys.modules.get(module_name)
+        if module is not None:
+            return getattr(module, '__file__', None)
+        if module_name.partition('.')[0] in sys.builtin_module_names:
+            return None
+        search_path = self.search_path if self.search_path is not None else sys.path
+        # an empty entry stands for the current directory, which is the importing one
+        dirs = [i or base_dir for i in search_path]
+        file_path = self._find(dirs, module_name.split('.'))
+        if file_path is False:
+            return self._fallback(module_name, level, base_dir)
+        return file_path
+
+    def _listdir(self, dir):
+        listing = self._listings.get(dir)
+        if listing is None:
+            try:
+                listing = frozenset(os.listdir(dir))
+            except OSError:
+                listing = frozenset()
+            self._listings[dir] = listing
+        return listing
+
+    def _find_part(self, name, dirs):
+        namespace = []
+        for dir in dirs:
+            listing = self._listdir(dir)
+            if name in listing:
+                pkg_dir = osp.join(dir, name)
+                pkg_listing = self._listdir(pkg_dir)
+                for suffix in self._SUFFIXES:
+                    if '__init__' + suffix in pkg_listing:
+                        return [pkg_dir], osp.join(pkg_dir, '__init__' + suffix)
+                if osp.isdir(pkg_dir):
+                    # a module of the same directory comes first, as with `FileFinder`
+                    namespace.append(pkg_dir)
+            for suffix in self._SUFFIXES:
+                if name + suffix in listing:
+                    return None, osp.join(dir, name + suffix)
+        if namespace:
+            return namespace, None
+        return None
+
+    def _find(self, dirs, parts):
+        # returns False if the module can not be found
+        file_path = None
+        if not parts:
+            # `from . import x`, resolve to the package itself
+            listing = self._listdir(dirs[0])
+            for suffix in self._SUFFIXES:
+                if '__init__' + suffix in listing:
+                    return osp.join(dirs[0], '__init__' + suffix)
+            return None
+        for part in parts:
+            if dirs is None:
+                # the parent is a plain module, not a package
+                return False
+            found = self._find_part(part, dirs)
+            if found is None:
+                return False
+            dirs, file_path = found
+        return file_path
+
+
+class CachedResolver(ModuleResolver):
+    """Memoize the resolutions of another resolver in a `ResolutionCache`.
+
+    Absolute imports are shared by all importing files, unless the directory of
+    the importer holds a module of the same top level name, which shadows the
+    shared one when the current directory is searched.
+    """
+
+    def __init__(self, resolver: ModuleResolver, cache: Optional[ResolutionCache] = None):
+        self.resolver = resolver
+        self.cache = cache if cache is not None else ResolutionCache()
+        self._listings: Dict[str, frozenset] = {}
+
+    def __call__(self, module_name, level=0, base_dir=None):
+        base_dir = base_dir or os.getcwd()
+        if level:
+            key = f'{_get_anchor_dir(base_dir, level)}|{level}|{module_name or ""}'
+        else:
+            local_key = f'{base_dir}|0|{module_name}'
+            key = local_key if self._is_shadowed(module_name, base_dir) else module_name
+        found, file_path = self.cache.lookup(key)
+        if found:
+            return file_path
+
+        file_path = self.resolver(module_name, level, base_dir)
+        if not level and file_path is not None and file_path.startswith(base_dir + os.sep):
+            key = local_key
+        self.cache.set(key, file_path)
+        return file_path
+
+    def _is_shadowed(self, module_name, base_dir):
+        # whether a sibling module of the importer has the top level name of `module_name`
+        listing = self._listings.get(base_dir)
+        if listing is None:
+            try:
+                listing = self._listings[base_dir] = frozenset(os.listdir(base_dir))
+            except OSError:
+                listing = self._listings[base_dir] = frozenset()
+        name = module_name.partition('.')[0]
+        return name in listing or any(name + i in listing for i in StaticResolver._SUFFIXES)
+
+    def refresh(self) -> None:
+        """Forget the directory listings, e.g. once files were added or removed."""
+        self._listings.clear()
+
+
+_RESOLVERS = {
+    'import': ImportResolver,
+    'static': StaticResolver,
+}
+
+
+def _build_resolver(resolver: Union[str, ModuleResolver, None]) -> ModuleResolver:
+    if resolver is None:
+        resolver = 'import'
+    if isinstance(resolver, str):
+        if resolver not in _RESOLVERS:
+            raise ValueError(f'Unknown resolver: {resolver}, expected one of {list(_RESOLVERS)}')
+        resolver = _RESOLVERS[resolver]()
+    return resolver
+
+
+class _NodeRef:
+    """Base of the records which refer to a node of the ast.
+
+    When pickled, the node is replaced by its position, and it is bound again
+    once the ast of the owner parser is loaded.
+    """
+
+    __slots__ = ('_node', '_owner')
+
+    @property
+    def node(self):
+        if isinstance(self._node, tuple) and self._owner is not None:
+            # loading the ast binds the nodes
+            self._owner.ast
+        return self._node
+
+    @node.setter
+    def node(self, node):
+        self._node = node
+
+    def __getstate__(self):
+        state = {}
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                if name != '_owner' and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        node = state['_node']
+        if isinstance(node, AST):
+            state['_node'] = (node.lineno, node.col_offset)
+        return state
+
+    def __setstate__(self, state):
+        self._owner = None
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class _ImportNode(_NodeRef):
+    __slots__ = (
+        'import_name',
+        'module',
+        'alias_name',
+        'source_name',
+        'level',
+        'is_import_from',
+        'is_target',
+    )
+
     node: Union[ImportFrom, Import]
     import_name: str
     module: str
     alias_name: Optional[str]
-    is_target: bool = False
+    is_target: bool
 
-    def _parse_module(self, endpoints):
+    def __init__(
+        self,
+        node: Union[ImportFrom, Import],
+        import_name: str,
+        module: str,
+        alias_name: Optional[str] = None,
+        source_name: Optional[str] = None,
+    ) -> None:
+        self._owner = None
+        self.node = node
+        # the same names appear in many files
+        self.import_name = sys.intern(import_name)
+        self.module = sys.intern(module) if module else module
+        self.alias_name = alias_name
+        # the name in the imported module, `b` of `from a import b as c`
+        self.source_name = sys.intern(source_name) if source_name else source_name
+        self.level = getattr(node, 'level', 0) or 0
+        self.is_import_from = isinstance(node, ImportFrom)
+        self.is_target = False
+
+    def _mark_target(self):
+        self.is_target = True
+        # the node may be not loaded yet, it will be marked when bound.
+        if isinstance(self._node, AST):
+            self._mark_node()
+
+    def _mark_node(self):
+        node = self._node
+        node.is_target = True
+        if not self.is_import_from:
+            # the names of an `import` statement are rewritten one by one
+            names = getattr(node, 'target_names', None)
+            if names is None:
+                names = node.target_names = set()
+            names.add(self.import_name)
+
+    def _parse_module(self, endpoints, resolver: Optional[ModuleResolver] = None, base_dir=None):
         module_name = self.module
-        # need cache to prevent some heavy imports?
-        try:
-            imported_module = importlib.import_module(module_name)
-            assert imported_module is not None
-            if not hasattr(imported_module, '__file__'):
-                return None
-            file_path = imported_module.__file__
-        except ModuleNotFoundError:
-            # just a workaround for relative import
-            # should find some other methods.
-            with cd('.' * self.node.level):
-                file_path = os.path.join(os.getcwd(), module_name.replace('.', os.sep) + '.py')
-            if not os.path.exists(file_path):
-                raise RuntimeError(f'Cannot import module {module_name}')
+        if not self.level and endpoints.check_module(module_name):
+            # e.g. the standard library, neither imported nor searched
+            return None
+        if resolver is None:
+            resolver = ImportResolver()
+        file_path = resolver(module_name, self.level, base_dir)
+        if file_path is None:
+            return None
         if not endpoints.check(locals()):
             # FIXME (Asthestarsfalll): may produce inconsistent results due to some unknown reasons.
             # ugly patch
-            self.node.is_target = True
-            self.is_target = True
+            self._mark_target()
             return file_path
 
 
 class _CallNode:
+    __slots__ = ('name', 'trace_info')
+
     name: str
     trace_info: List[str]
 
+    def __init__(self, name: str, trace_info: List[str]) -> None:
+        self.name = sys.intern(name) if name else name
+        self.trace_info = trace_info
+
 
 class _DefType(Enum):
     Function = 0
@@ -499,7 +2122,9 @@ class _DefType(Enum):
     Method = 2
 
 
-class _DefNode:
+class _DefNode(_NodeRef):
+    __slots__ = ('name', 'def_type', 'parent', 'bases', 'metas')
+
     def __init__(
         self,
         node: Union[FunctionDef, ClassDef],
@@ -510,7 +2135,8 @@ class _DefNode:
     ) -> None:
         if not isinstance(node, (FunctionDef, ClassDef)):
             raise TypeError()
-        self.name = node.name
+        self._owner = None
+        self.name = sys.intern(node.name)
         self.def_type = def_type
         self.parent = parent
         self.node = node
@@ -523,13 +2149,13 @@ class _DefNode:
 
 class _PassController:
     def __init__(self) -> None:
-        self.attached = []
+        self.attached = set()
 
     def attach(self, inp: Any) -> None:
-        self.attached.append(id(inp))
+        self.attached.add(id(inp))
 
     def detach(self, node: Any) -> None:
-        self.attached.remove(id(node))
+        self.attached.discard(id(node))
 
     def __call__(self, inp: Any) -> bool:
         if id(inp) in self.attached:
@@ -539,24 +2165,225 @@ class _PassController:
         return False
 
 
+# pushed after the children of a top level definition, to leave its scope
+_SCOPE_END = object()
+_SCOPE_TYPES = frozenset((FunctionDef, AsyncFunctionDef, ClassDef))
+_LEGACY_CONSTANT_VISITORS = (
+    'visit_Num',
+    'visit_Str',
+    'visit_Bytes',
+    'visit_NameConstant',
+    'visit_Ellipsis',
+)
+_CONTEXT_VISITORS = ('visit_Load', 'visit_Store', 'visit_Del')
+# fields holding identifiers, strings or numbers according to the ast grammar
+_NON_NODE_FIELDS = frozenset(
+    (
+        'name',
+        'id',
+        'attr',
+        'arg',
+        'asname',
+        'module',
+        'level',
+        'kind',
+        'type_comment',
+        'conversion',
+        'is_async',
+        'simple',
+        'tag',
+    )
+)
+
+
+def _get_child_fields(cls, visit_ctx=False):
+    # the fields which may hold child nodes, reversed
+    fields = [i for i in cls._fields if i not in _NON_NODE_FIELDS and (visit_ctx or i != 'ctx')]
+    if cls is Constant:
+        fields.remove('value')
+    return tuple(reversed(fields))
+
+
+class FileSummary:
+    """Everything collected from a file except its ast.
+
+    It is all the import graph walk needs, so the ast itself can be dropped
+    after analysis and loaded again only for the files which are generated.
+    """
+
+    __slots__ = (
+        'imports',
+        'uncertain_imports',
+        'local_defs',
+        'calls',
+        'to_merge_classes',
+        'uses',
+        'extra',
+    )
+
+    def __init__(self) -> None:
+        # store imported modules, functions, classes and variables
+        # FIXME(Asthestarsfalll): handle alias of the imported, as well as functions.partial...
+        self.imports: Dict[str, _ImportNode] = {}
+        self.uncertain_imports: List[_ImportNode] = []
+        self.local_defs: OrderedDict[str, _DefNode] = OrderedDict()
+        self.calls: Dict[str, _CallNode] = {}
+        self.to_merge_classes: Optional[Dict] = {}
+        # names used by each top level definition, '' for the module level statements
+        self.uses: Dict[str, Set[str]] = {}
+        # attributes added by the subclasses of DefaultASTParser
+        self.extra: Optional[Dict[str, Any]] = None
+
+
+def _summary_property(name):
+    def fget(self):
+        return getattr(self.summary, name)
+
+    def fset(self, value):
+        setattr(self.summary, name, value)
+
+    return property(fget, fset)
+
+
 class DefaultASTParser(NodeVisitor):
+    # not a part of the summary of a file
+    _TRANSIENT = (
+        '_ast',
+        '_ast_loader',
+        '_reload',
+        'endpoints',
+        '_pass_controller',
+        'summary',
+        'file_name',
+        'file_path',
+        '_scope',
+        '_budget',
+    )
+    _ast: Optional[AST] = None
+    _ast_loader: Optional[Callable[[], AST]] = None
+    _reload: Optional[Callable[[], AST]] = None
+    # keeps the loaded asts within `Parser(memory_limit=...)`
+    _budget: Optional[ASTBudget] = None
+
+    _imports = _summary_property('imports')
+    _uncertain_imports = _summary_property('uncertain_imports')
+    _local_defs = _summary_property('local_defs')
+    _calls = _summary_property('calls')
+    _to_merge_classes = _summary_property('to_merge_classes')
+    _uses = _summary_property('uses')
+
     def __init__(self, ast: AST, endpoints: EndPointManager, file_name: str):
         self.ast = ast
         self.endpoints = endpoints
         self.file_name = file_name
         self.file_path = os.path.dirname(file_name)
         self._pass_controller = _PassController()
-        # store imported modules, functions, classes and variables
-        # FIXME(Asthestarsfalll): handle alias of the imported, as well as functions.partial...
-        self._imports: Dict[str, _ImportNode] = {}
-        self._uncertain_imports: List[_ImportNode] = []
-        self._local_defs: OrderedDict[str, _DefNode] = OrderedDict()
-        self._calls: Dict[str, _CallNode] = {}
-        self._to_merge_classes: Optional[Dict] = {}
+        self.summary = FileSummary()
+        # the top level definition being visited, '' for the module level
+        self._scope = ''
         self.visit(self.ast)
 
-    def get_import_path(self):
-        import_path = [i._parse_module(self.endpoints) for i in self._imports.values()]
+    @property
+    def ast(self) -> AST:
+        if self._ast is None and self._ast_loader is not None:
+            tree = self._ast_loader()
+            self._ast_loader = None
+            self._ast = tree
+            self._bind_nodes(tree)
+        if self._budget is not None and self._ast is not None:
+            self._budget.touch(self)
+        return self._ast
+
+    @ast.setter
+    def ast(self, tree: AST):
+        self._ast = tree
+
+    def _get_records(self):
+        yield from self._imports.values()
+        yield from self._uncertain_imports
+        yield from self._local_defs.values()
+
+    def _bind_nodes(self, tree):
+        positions = {}
+        for node in ast.walk(tree):
+            if isinstance(node, (Import, ImportFrom, FunctionDef, ClassDef)):
+                positions.setdefault((node.lineno, node.col_offset), node)
+        for record in self._get_records():
+            if isinstance(record._node, tuple):
+                if record._node not in positions:
+                    raise RuntimeError(
+                        f'{self.file_name} has changed since it was analyzed, update it first.'
+                    )
+                record._node = positions[record._node]
+                if getattr(record, 'is_target', False):
+                    record._mark_node()
+
+    def get_summary(self) -> FileSummary:
+        """Everything collected from the file except the ast, it can be pickled."""
+        extra = {k: v for k, v in self.__dict__.items() if k not in self._TRANSIENT}
+        self.summary.extra = extra or None
+        return self.summary
+
+    @classmethod
+    def from_summary(
+        cls,
+        summary: FileSummary,
+        endpoints: EndPointManager,
+        file_name: str,
+        ast_loader: Callable[[], AST],
+    ):
+        """Rebuild a parser from `get_summary`, the ast is loaded by `ast_loader`
+        on first access."""
+        parser = cls.__new__(cls)
+        parser.summary = summary
+        if summary.extra:
+            parser.__dict__.update(summary.extra)
+        parser.endpoints = endpoints
+        parser.file_name = file_name
+        parser.file_path = os.path.dirname(file_name)
+        parser._pass_controller = _PassController()
+        parser._ast_loader = ast_loader
+        parser._reload = ast_loader
+        for record in parser._get_records():
+            record._owner = parser
+        return parser
+
+    def __reduce__(self):
+        # sent to other processes as the summary, the ast is parsed again there on first access
+        return _rebuild_parser, (self.__class__, self.get_summary(), self.file_name)
+
+    def release(self) -> bool:
+        """Drop the ast, it is loaded from the file again on next access.
+
+        Code generators rewrite the ast in place, releasing it gives the next one
+        a fresh ast. Returns False if the ast can not be loaded again.
+        """
+        if self._ast is None:
+            return True
+        if self._reload is None:
+            if not osp.isfile(self.file_name):
+                return False
+            self._reload = partial(parse_file, self.file_name)
+        self._unload(self._reload)
+        return True
+
+    def _unload(self, ast_loader):
+        # drop the ast, the records are bound again once it is loaded by `ast_loader`
+        for record in self._get_records():
+            node = record._node
+            if isinstance(node, AST):
+                record._node = (node.lineno, node.col_offset)
+            record._owner = self
+        self._ast = None
+        self._ast_loader = ast_loader
+        if self._budget is not None:
+            self._budget.discard(self)
+
+    def get_import_path(self, resolver: Optional[ModuleResolver] = None):
+        import_path = [
+            i._parse_module(self.endpoints, resolver, self.file_path)
+            for i in self._imports.values()
+        ]
         return [i for i in import_path if i]
 
     def get_target_import_names(self):
@@ -581,12 +2408,55 @@ class DefaultASTParser(NodeVisitor):
         print('LocalDef:\n', self._local_defs)
 
     def visit(self, node):
-        if not self._pass_controller(node):
-            method = 'visit_' + node.__class__.__name__
-            visitor = getattr(self, method, None)
-            if visitor:
-                visitor(node)
-        return self.generic_visit(node)
+        # walk with an explicit stack in the same order as `generic_visit`,
+        # deeply nested code can not exceed the recursion limit.
+        table = {}
+        visit_ctx = any(hasattr(self, i) for i in _CONTEXT_VISITORS)
+        skipped = self._pass_controller.attached
+        stack = [node]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            cur = pop()
+            if cur is _SCOPE_END:
+                self._scope = ''
+                continue
+            cls = cur.__class__
+            try:
+                handler, fields = table[cls]
+            except KeyError:
+                handler, fields = table[cls] = self._get_handler(cls), _get_child_fields(
+                    cls, visit_ctx
+                )
+
+            if not self._scope and cls in _SCOPE_TYPES:
+                # names used by a top level definition are collected apart
+                self._scope = cur.name
+                self._uses.setdefault(cur.name, set())
+                push(_SCOPE_END)
+            if skipped and id(cur) in skipped:
+                skipped.remove(id(cur))
+            elif handler is not None:
+                handler(cur)
+
+            # pushed in reverse, so that they are popped in order
+            for field in fields:
+                value = getattr(cur, field, None)
+                if value.__class__ is list:
+                    for item in reversed(value):
+                        if isinstance(item, AST):
+                            push(item)
+                elif isinstance(value, AST):
+                    push(value)
+        return node
+
+    def _get_handler(self, cls):
+        handler = getattr(self, 'visit_' + cls.__name__, None)
+        if getattr(handler, '__func__', None) is NodeVisitor.visit_Constant:
+            # it only dispatches to the deprecated visit_Str, visit_Num... and visits the children
+            if not any(hasattr(self, i) for i in _LEGACY_CONSTANT_VISITORS):
+                return None
+        return handler
 
     # Do not support for the case that directly import local module for now.
     # This requires analyzing the call of function/class,
@@ -600,7 +2470,7 @@ class DefaultASTParser(NodeVisitor):
                 module_name = import_name.name
             else:
                 module_name = node.module
-            import_node = _ImportNode(node, name, module_name, import_name.asname)
+            import_node = _ImportNode(node, name, module_name, import_name.asname, import_name.name)
             if name != '*':
                 # FIXME(Asthestarsfalll): add some code to handle overridden imports.
                 # TODO(Asthestarsfalll): use endpoint to sign the target imports and the others,
@@ -634,34 +2504,37 @@ class DefaultASTParser(NodeVisitor):
         self._local_defs[node.name] = _DefNode(node, _DefType.Class, bases=bases)
 
     def _get_chained_name(self, node, trace_info):
-        if isinstance(node, Attribute):
-            trace_info.append(node.attr)
-            trace_info.append('.')
-            node = node.value
-            return self._get_chained_name(node, trace_info)
-        elif isinstance(node, Call):
-            self._pass_controller.attach(node)
-            node = node.func
-            trace_info.append('()')
-            return self._get_chained_name(node, trace_info)
-        elif isinstance(node, Subscript):
-            idx = node.slice.value
-            if hasattr(idx, 'value'):
-                idx = idx.value
-            elif hasattr(idx, 'id'):
-                idx = idx.id
+        while True:
+            if isinstance(node, Attribute):
+                trace_info.append(node.attr)
+                trace_info.append('.')
+                node = node.value
+            elif isinstance(node, Call):
+                self._pass_controller.attach(node)
+                node = node.func
+                trace_info.append('()')
+            elif isinstance(node, Subscript):
+                idx = node.slice
+                if not isinstance(idx, ast.expr):
+                    # `ast.Index` before python 3.9
+                    idx = idx.value
+                if isinstance(idx, Constant):
+                    idx = idx.value
+                elif isinstance(idx, Name):
+                    idx = idx.id
+                else:
+                    idx = ast.unparse(idx)
+                trace_info.append(f'[{idx}]')
+                node = node.value
+            elif isinstance(node, Constant):
+                node.id = trace_info[-1]
+                return node
+            elif isinstance(node, Name):
+                trace_info.append(node.id)
+                return node
             else:
-                raise RuntimeError()
-            trace_info.append(f'[{idx}]')
-            return self._get_chained_name(node.value, trace_info)
-        elif isinstance(node, Constant):
-            node.id = trace_info[-1]
-            return node
-        elif isinstance(node, Name):
-            trace_info.append(node.id)
-            return node
-        else:
-            raise NotImplementedError(f'Unsupported type: {type(node)}')
+                # calls on expressions, e.g. `(a or b)()` or `f'{a}'.strip()`
+                return None
 
     # damn it! Need to find some way to simplify those chained cases:
     # self.xxx[0][0].xx()
@@ -678,67 +2551,487 @@ class DefaultASTParser(NodeVisitor):
         func = node.func
         trace_info = []
         func = self._get_chained_name(func, trace_info)
+        if func is None and not trace_info:
+            return
 
-        name = func.id
+        name = getattr(func, 'id', None)
         if trace_info:
             trace_info.reverse()
             name = ''.join(trace_info)
         # if name not in self._local_defs:
         # just build them, and clean it after whole parse stage
         # prevent some issues caused by visit order (maybe)
-        self._calls[name] = _CallNode(name, trace_info)
-
-    # for getattr, but it also will be caught by visit_Call
-    # maybe not need
-    def visit_Str(self, node: Constant):
-        pass
+        self.summary.calls[name] = _CallNode(name, trace_info)
+
+    def visit_Name(self, node: Name):
+        if isinstance(node.ctx, ast.Load):
+            self._add_use(node.id)
+
+    def visit_Attribute(self, node: Attribute):
+        # only the whole chain `a.b.c` is used, not `a.b` or `a`
+        chain = [node.attr]
+        value = node.value
+        while isinstance(value, Attribute):
+            self._pass_controller.attach(value)
+            chain.append(value.attr)
+            value = value.value
+        if isinstance(value, Name):
+            self._pass_controller.attach(value)
+            chain.append(value.id)
+            chain.reverse()
+            self._add_use('.'.join(chain))
+
+    def _add_use(self, name):
+        all_uses = self.summary.uses
+        uses = all_uses.get(self._scope)
+        if uses is None:
+            uses = all_uses[self._scope] = set()
+        uses.add(sys.intern(name))
 
     def print(self):
+        from astpretty import pprint  # for pdb debug
+
         pprint(self.ast)
 
 
+def _rebuild_parser(parser_type, summary, file_name):
+    return parser_type.from_summary(summary, None, file_name, partial(parse_file, file_name))
+
+
+def _count_nodes(tree):
+    return sum(1 for _ in ast.walk(tree))
+
+
+def _analyze_file(parser_type, file, parse_cache=None, profile=False):
+    # runs in the workers of `Parser`, only the summary and the timings are sent back
+    stats = Stats() if profile else NULL_STATS
+    with stats.phase('read'):
+        with open(file, 'rb') as f:
+            source = f.read()
+    with stats.phase('parse'):
+        tree = ast.parse(source, file)
+    with stats.phase('visit'):
+        parser = parser_type(tree, None, file)
+    if profile:
+        stats.count('nodes_visited', _count_nodes(tree))
+    summary = parser.get_summary()
+    digest = None
+    if parse_cache is not None:
+        digest = parse_cache.store(file, source, summary, tree)
+    return summary, digest, (stats.phases, stats.counters) if profile else None
+
+
+# bytes taken by a node of the ast, measured on CPython 3.11
+_AST_NODE_SIZE = 240
+
+
+class ASTBudget:
+    """Keep the asts loaded by the parsers within `limit` bytes.
+
+    Past the limit, the least recently used asts are pickled to a temporary
+    directory and dropped, their parsers load them from there on next access.
+    The summaries are never spilled. The size of an ast is estimated from its
+    node count, and the asts being rewritten are held in memory.
+    """
+
+    def __init__(self, limit: int, stats: Stats = NULL_STATS) -> None:
+        self.limit = limit
+        self._stats = stats
+        # parser -> estimated size of its ast, the least recently used first
+        self._loaded: OrderedDict[DefaultASTParser, int] = OrderedDict()
+        self._held: Set[DefaultASTParser] = set()
+        self._dir: Optional[tempfile.TemporaryDirectory] = None
+        self.used = 0
+        self.peak = 0
+        self.spills = 0
+        self.reloads = 0
+        self.spilled_bytes = 0
+
+    def touch(self, parser: DefaultASTParser) -> None:
+        """Record an access to the ast of `parser`, spilling others past the limit."""
+        if parser in self._loaded:
+            self._loaded.move_to_end(parser)
+            return
+        size = _count_nodes(parser._ast) * _AST_NODE_SIZE
+        self._loaded[parser] = size
+        self.used += size
+        self.peak = max(self.peak, self.used)
+        if self.used > self.limit:
+            for i in list(self._loaded):
+                if i is not parser and i not in self._held:
+                    self._spill(i)
+                    if self.used <= self.limit:
+                        break
+
+    def discard(self, parser: DefaultASTParser) -> None:
+        size = self._loaded.pop(parser, None)
+        if size is not None:
+            self.used -= size
+
+    @contextmanager
+    def hold(self, parser: DefaultASTParser):
+        """The ast of `parser` is not spilled in the block, e.g. while it is rewritten."""
+        self._held.add(parser)
+        try:
+            yield
+        finally:
+            self._held.discard(parser)
+
+    def _spill(self, parser):
+        with self._stats.phase('spill', parser.file_name):
+            try:
+                data = pickle.dumps(parser._ast, pickle.HIGHEST_PROTOCOL)
+            except RecursionError:
+                # too deep to pickle, parsed from the source again if possible
+                parser.release()
+                return
+            if self._dir is None:
+                # removed along with the budget
+                self._dir = tempfile.TemporaryDirectory(prefix='codeslim-spill-')
+            fd, path = tempfile.mkstemp(suffix='.pkl', dir=self._dir.name)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+        parser._unload(partial(self._load, path))
+        self.spills += 1
+        self.spilled_bytes += len(data)
+        self._stats.count('asts_spilled')
+
+    def _load(self, path):
+        with open(path, 'rb') as f:
+            tree = pickle.load(f)
+        os.remove(path)
+        self.reloads += 1
+        self._stats.count('asts_reloaded')
+        return tree
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'limit': self.limit,
+            'peak': self.peak,
+            'spills': self.spills,
+            'reloads': self.reloads,
+            'spilled_bytes': self.spilled_bytes,
+        }
+
+
 class Parser:
-    def __init__(self, entry: Entry, endpoints=None, parser_type=DefaultASTParser):
-        self.cache = set(*entry.get_cache())
+    def __init__(
+        self,
+        entry: Entry,
+        endpoints=None,
+        parser_type=DefaultASTParser,
+        resolver: Union[str, ModuleResolver, None] = None,
+        cache_dir: Optional[str] = None,
+        jobs: int = 1,
+        keep_ast: bool = False,
+        trace: str = 'file',
+        profile: bool = False,
+        # trace the imports at once, else with `parse` or `iter_parse`
+        analyze: bool = True,
+        # bytes of asts kept in memory, the least recently used ones are spilled to disk past it
+        memory_limit: Optional[int] = None,
+    ):
+        if trace not in ('file', 'symbol'):
+            raise ValueError(f'Unknown trace mode: {trace}')
+        self.cache = set(entry.get_cache())
+        # timings and counters, recording nothing unless `profile`
+        self.stats = Stats() if profile else NULL_STATS
+        self.budget = ASTBudget(memory_limit, self.stats) if memory_limit is not None else None
         if endpoints is None:
-            endpoints = LocalEndPoint(os.path.commonprefix(list(self.cache)))
+            local = LocalEndPoint(os.path.commonprefix(list(self.cache)))
+            # the local modules shadow the standard ones of the same name
+            endpoints = [local, StdlibEndPoint(_list_modules(local.local_dir))]
         self.entry = entry
         self.parser_type = parser_type
         self.endpoints = EndPointManager(endpoints)
-        self.ast_parsers = self._build_parsers(self.entry)
+        # 'import' imports every module to find its file, 'static' only searches the file system
+        self.resolution_cache = ResolutionCache(cache_dir)
+        self.resolver = CachedResolver(_build_resolver(resolver), self.resolution_cache)
+        self.parse_cache = ParseCache(cache_dir, parser_type) if cache_dir else None
+        # analyze the files of each level of the import graph in a process pool
+        self.jobs = jobs
+        self._pool = None
+        # by default only the summaries are kept after analysis, the asts are
+        # loaded again for the files which are generated.
+        self.keep_ast = keep_ast
+        # 'file' follows every import of the traced files, 'symbol' only follows
+        # the imports used by the live definitions, starting from the entries.
+        self.trace = trace
+        # live names of each traced file, None stands for the whole file
+        self.live_symbols: Dict[str, Set[Optional[str]]] = {}
+        self._import_targets: Dict[str, Dict[str, Optional[str]]] = {}
+        if self._load_from_files:
+            self.ast_parsers = self._load_parsers(entry.get_cache())
+        else:
+            self.ast_parsers = self._build_parsers(self.entry)
         self.relations = defaultdict(list)
-        self.parse()
+        self._entries = list(self.ast_parsers)
+        if analyze:
+            self.parse()
 
     def _build_parsers(self, entry):
         parsers = {}
-        for file, ast in entry:
-            parsers[file] = self.parser_type(ast, self.endpoints, file)
+        # the entry builds its asts on demand
+        with self.stats.phase('parse'):
+            items = list(entry)
+        for file, tree in items:
+            with self.stats.phase('visit', file):
+                parser = self.parser_type(tree, self.endpoints, file)
+            if self.stats.enabled:
+                self.stats.count('files_parsed')
+                self.stats.count('nodes_visited', _count_nodes(tree))
+            if not self.keep_ast:
+                parser.release()
+            self._track(parser)
+            parsers[file] = parser
         return parsers
 
+    def _track(self, parser):
+        # the ast of `parser` is kept within the memory limit from now on
+        if self.budget is not None:
+            parser._budget = self.budget
+            if parser._ast is not None:
+                self.budget.touch(parser)
+
+    @property
+    def _load_from_files(self):
+        # the files are read, parsed, cached and timed here file by file, unless the entry
+        # converts them on its own
+        return type(self.entry).convert_to_ast is FileEntry.convert_to_ast
+
+    def _from_summary(self, file, summary, digest):
+        ast_loader = partial(self._load_ast, file, digest)
+        parser = self.parser_type.from_summary(summary, self.endpoints, file, ast_loader)
+        self._track(parser)
+        return parser
+
+    def _load_parsers(self, files):
+        stats = self.stats
+        parsers = {}
+        missing = []
+        for file in files:
+            cached = self.parse_cache.load(file) if self.parse_cache is not None else None
+            if cached is not None:
+                parsers[file] = self._from_summary(file, *cached)
+            else:
+                missing.append(file)
+
+        if self.jobs > 1 and len(missing) > 1:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.jobs)
+            # largest files first, so that the stragglers do not dominate
+            missing.sort(key=osp.getsize, reverse=True)
+            futures = [
+                self._pool.submit(
+                    _analyze_file, self.parser_type, file, self.parse_cache, stats.enabled
+                )
+                for file in missing
+            ]
+            for file, future in zip(missing, futures):
+                summary, digest, profiled = future.result()
+                if profiled is not None:
+                    # the time spent in the workers
+                    phases, counters = profiled
+                    for name, (wall, cpu, _) in phases.items():
+                        stats.add(name, wall, cpu, file)
+                    stats.counters.update(counters)
+                stats.count('files_parsed')
+                if self.parse_cache is not None:
+                    self.parse_cache.stores += 1
+                parsers[file] = self._from_summary(file, summary, digest)
+        else:
+            for file in missing:
+                with stats.phase('read', file):
+                    with open(file, 'rb') as f:
+                        source = f.read()
+                with stats.phase('parse', file):
+                    tree = ast.parse(source, file)
+                with stats.phase('visit', file):
+                    parser = self.parser_type(tree, self.endpoints, file)
+                if stats.enabled:
+                    stats.count('files_parsed')
+                    stats.count('nodes_visited', _count_nodes(tree))
+                if self.parse_cache is not None:
+                    digest = self.parse_cache.store(file, source, parser.get_summary(), tree)
+                    parser._reload = partial(self._load_ast, file, digest)
+                if not self.keep_ast:
+                    parser.release()
+                self._track(parser)
+                parsers[file] = parser
+        return {file: parsers[file] for file in files}
+
+    def _load_ast(self, file, digest):
+        if self.parse_cache is not None and digest is not None:
+            try:
+                return self.parse_cache.load_ast(digest)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+        return parse_file(file)
+
     def parse(self):
-        temp = list(self.ast_parsers.values())
-        module_path = []
-
-        def _update_path():
-            module_path.clear()
-            for i in temp:
-                # for some local imports
-                with cd(i.file_path):
-                    paths = set(i.get_import_path())
-                self.relations[os.path.join(i.file_path, i.file_name)].extend(paths)
-                for p in paths:
-                    if p not in self.cache:
-                        module_path.append(p)
-                        self.cache.add(p)
-
-        _update_path()
-        while len(module_path) > 0:
-            # new_entry = [self.entry.build(p) for p in module_path]
-            entry = self.entry.build(module_path)
-            parsers = self._build_parsers(entry)
-            temp = list(parsers.values())
-            self.ast_parsers.update(parsers)
-            _update_path()
+        for _ in self.iter_parse():
+            pass
+
+    def iter_parse(self) -> Iterator[List[str]]:
+        """Trace the entries, yields the files of each level of the import graph
+        once their imports are resolved, before the files they import are parsed.
+
+        With the 'symbol' trace the imports followed are only known once the whole
+        graph is traced, so all the files are yielded at once.
+        """
+        if self.trace == 'symbol':
+            self._trace_symbols()
+            yield list(self.ast_parsers)
+        else:
+            yield from self._iter_trace(list(self.ast_parsers))
+
+    def _add_relation(self, file, target):
+        paths = self.relations[file]
+        if target not in paths:
+            paths.append(target)
+
+    def _trace_symbols(self):
+        try:
+            self.live_symbols = Reachability(self, load=True).run(self._entries)
+        finally:
+            self._shutdown_pool()
+        self.resolution_cache.save()
+
+    def _resolve_imports(self, parser):
+        targets = {}
+        with self.stats.phase('resolve', parser.file_name):
+            for name, import_node in parser._imports.items():
+                targets[name] = import_node._parse_module(
+                    self.endpoints, self.resolver, parser.file_path
+                )
+        self.stats.count('imports_resolved', len(targets))
+        self._import_targets[parser.file_name] = targets
+
+    def get_reachability(self) -> Reachability:
+        """The live names of the traced files, from the entries on.
+
+        Only the imported names the live code refers to are live, the code
+        generators remove the other imports of the traced files.
+        """
+        reachability = Reachability(self)
+        reachability.run(self._entries)
+        self.resolution_cache.save()
+        return reachability
+
+    def follow_imports(self) -> List[str]:
+        """Trace every file imported by the traced files, as the 'file' trace does.
+
+        Whole files are generated from the 'symbol' trace this way, the imports left
+        out by it are still found in them. Returns the newly traced files.
+        """
+        return self._trace(list(self.ast_parsers))
+
+    def _trace(self, files):
+        # resolve the imports of `files` and parse the newly found files level by level,
+        # returns the newly found files.
+        levels = list(self._iter_trace(files))
+        return [i for files in levels[1:] for i in files]
+
+    def _iter_trace(self, files):
+        # yields `files`, then each level of newly found files, once their imports are resolved
+        try:
+            while files:
+                module_path = []
+                for file in files:
+                    i = self.ast_parsers[file]
+                    # local imports are resolved against the directory of the file
+                    with self.stats.phase('resolve', i.file_name):
+                        paths = set(i.get_import_path(self.resolver))
+                    self.stats.count('imports_resolved', len(i._imports))
+                    self.relations[os.path.join(i.file_path, i.file_name)] = list(paths)
+                    for p in paths:
+                        if p not in self.cache:
+                            module_path.append(p)
+                            self.cache.add(p)
+                yield files
+                if not module_path:
+                    break
+                if self._load_from_files:
+                    parsers = self._load_parsers(module_path)
+                else:
+                    entry = self.entry.build(module_path)
+                    parsers = self._build_parsers(entry)
+                self.ast_parsers.update(parsers)
+                files = list(parsers)
+        finally:
+            self._shutdown_pool()
+        self.resolution_cache.save()
+
+    def _shutdown_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def update(self, files: Sequence[str]):
+        """Analyze the traced `files` again after they changed.
+
+        Only their imports are resolved again, and only newly imported files are
+        parsed. Returns the files analyzed again or newly traced, and the ones removed
+        or no longer imported from the entries.
+        """
+        files = [os.path.abspath(i) for i in files]
+        removed = [i for i in files if i in self.ast_parsers and not osp.exists(i)]
+        if self.budget is not None:
+            for file in files:
+                if file in self.ast_parsers:
+                    self.budget.discard(self.ast_parsers[file])
+        for file in removed:
+            del self.ast_parsers[file]
+            self.relations.pop(file, None)
+            self.cache.discard(file)
+            for paths in self.relations.values():
+                if file in paths:
+                    paths[:] = [i for i in paths if i != file]
+
+        changed = [i for i in files if i in self.ast_parsers]
+        for file in changed:
+            self._import_targets.pop(file, None)
+        # new modules may shadow others
+        self.resolver.refresh()
+        parsers = self._load_parsers(changed)
+        self.ast_parsers.update(parsers)
+        if self.trace != 'symbol':
+            traced = self._trace(list(parsers))
+            # the files no longer imported from the entries are dropped
+            reachable = self._get_reachable()
+            dropped = self._drop([i for i in self.ast_parsers if i not in reachable])
+            traced = [i for i in traced if i in reachable]
+            return [i for i in changed if i in reachable] + traced, removed + dropped
+
+        # which symbols are live may change anywhere, trace again from the entries,
+        # the unchanged files are neither parsed nor resolved again.
+        previous = set(self.ast_parsers)
+        self.relations.clear()
+        self._trace_symbols()
+        dropped = self._drop([i for i in self.ast_parsers if i not in self.live_symbols])
+        traced = [i for i in self.ast_parsers if i not in previous]
+        return changed + traced, removed + dropped
+
+    def _get_reachable(self):
+        # the traced files imported from the entries, directly or not
+        reachable = set()
+        stack = [i for i in self._entries if i in self.ast_parsers]
+        while stack:
+            file = stack.pop()
+            if file not in reachable:
+                reachable.add(file)
+                stack.extend(i for i in self.relations.get(file, ()) if i in self.ast_parsers)
+        return reachable
+
+    def _drop(self, files):
+        for file in files:
+            if self.budget is not None:
+                self.budget.discard(self.ast_parsers[file])
+            del self.ast_parsers[file]
+            self.relations.pop(file, None)
+            self._import_targets.pop(file, None)
+            self.cache.discard(file)
+        return files
 
     def info(self):
         for file, parser in self.ast_parsers.items():
@@ -749,6 +3042,176 @@ class Parser:
         return self.ast_parsers
 
 
+class Reachability:
+    """The live top level names of a program, from its entries on.
+
+    The names used by each definition form a graph across the files, walked with a
+    worklist of (file, name) until no new live name is found. The name is None for the
+    whole file, and '' for its module level statements which run as soon as the file
+    is imported. Dotted and chained names, `a.b.c` or `a.b().c`, are followed to the
+    file defining them through the longest imported prefix, so only the names the
+    live code refers to are live, not everything a live file imports.
+
+    With `load`, the files reached for the first time are analyzed and added to the
+    parser, as done by `Parser(trace='symbol')`; otherwise only the traced files are
+    walked. The files reached are analyzed together once the worklist runs dry, so
+    that they are spread over the process pool of the parser.
+    """
+
+    def __init__(self, parser: Parser, load: bool = False):
+        self.parser = parser
+        self.load = load
+        # file -> live names
+        self.live: Dict[str, Set[Optional[str]]] = {}
+        # file -> the names the live code of the file refers to, `a` of `a.b.c`
+        self.referenced: Dict[str, Set[str]] = {}
+
+    def __getstate__(self):
+        # sent to the workers of the code generators without the parser
+        state = self.__dict__.copy()
+        state['parser'] = None
+        return state
+
+    def is_live(self, file: str, name: str) -> bool:
+        names = self.live.get(file)
+        return names is not None and (None in names or name in names)
+
+    def is_referenced(self, file: str, name: str) -> bool:
+        """Whether the live code of `file` refers to the name `name` bound in the file."""
+        return name in self.referenced.get(file, ())
+
+    def run(self, entries: Sequence[str]) -> Dict[str, Set[Optional[str]]]:
+        parser = self.parser
+        self.live = live = {}
+        self.referenced = {}
+        worklist = deque((file, None) for file in entries)
+        # the (file, name) of the files not analyzed yet
+        pending = []
+        while worklist or pending:
+            if not worklist:
+                files = list(dict.fromkeys(file for file, _ in pending))
+                parser.ast_parsers.update(parser._load_parsers(files))
+                parser.cache.update(files)
+                worklist.extend(pending)
+                pending = []
+                continue
+            file, name = worklist.popleft()
+            names = live.get(file)
+            if names is not None and (None in names or name in names):
+                continue
+            ast_parser = parser.ast_parsers.get(file)
+            if ast_parser is None:
+                if self.load:
+                    pending.append((file, name))
+                continue
+            if names is None:
+                names = live[file] = set()
+                if self.load or file not in parser._import_targets:
+                    parser._resolve_imports(ast_parser)
+                # the module level statements run as soon as the file is imported
+                worklist.append((file, ''))
+            names.add(name)
+
+            uses = ast_parser._uses
+            if name is None:
+                used = set()
+                for i in uses.values():
+                    used.update(i)
+            elif name == '' or name in uses:
+                used = uses.get(name, ())
+            elif name in ast_parser._imports:
+                # imported and exported again
+                used = {name}
+            else:
+                used = ()
+                self._follow_missing(ast_parser, name, worklist)
+            for use in sorted(used):
+                self._follow_use(ast_parser, use, worklist)
+        return live
+
+    def _add_relation(self, file, target):
+        # the relations of the traced files are known already
+        if self.load:
+            self.parser._add_relation(file, target)
+
+    def _follow_use(self, ast_parser, use, worklist):
+        file = ast_parser.file_name
+        parts = _split_chain(use)
+        if not parts:
+            return
+        referenced = self.referenced.get(file)
+        if referenced is None:
+            referenced = self.referenced[file] = set()
+        referenced.add(parts[0])
+        imports = ast_parser._imports
+        for i in range(len(parts), 0, -1):
+            name = '.'.join(parts[:i])
+            if name not in imports:
+                continue
+            target = self.parser._import_targets[file][name]
+            if target is None:
+                return
+            self._add_relation(file, target)
+            import_node = imports[name]
+            if import_node.is_import_from:
+                worklist.append((target, import_node.source_name))
+            else:
+                # `import a.b` then `a.b.c`, only `c` of `a.b` is used
+                worklist.append((target, parts[i] if i < len(parts) else None))
+            return
+        if parts[0] in ast_parser._uses:
+            worklist.append((file, parts[0]))
+            return
+        # `import a.b` binds `a`, then `a.c` needs the module `a.b` to be imported
+        targets = self.parser._import_targets[file]
+        for name, import_node in imports.items():
+            if (
+                not import_node.is_import_from
+                and not import_node.alias_name
+                and name.partition('.')[0] == parts[0]
+            ):
+                if targets.get(name):
+                    self._add_relation(file, targets[name])
+                    worklist.append((targets[name], ''))
+
+    def _follow_missing(self, ast_parser, name, worklist):
+        # the name is neither defined nor imported explicitly
+        parser = self.parser
+        for import_node in ast_parser._uncertain_imports:
+            target = import_node._parse_module(
+                parser.endpoints, parser.resolver, ast_parser.file_path
+            )
+            if target:
+                self._add_relation(ast_parser.file_name, target)
+                worklist.append((target, name))
+        if _get_file_name(ast_parser.file_name) == '__init__':
+            # maybe a submodule of the package
+            try:
+                target = parser.resolver(name, 1, ast_parser.file_path)
+            except RuntimeError:
+                target = None
+            if target and not parser.endpoints.check({'file_path': target, 'module_name': name}):
+                self._add_relation(ast_parser.file_name, target)
+                worklist.append((target, None))
+
+
+def _split_chain(name):
+    # `a.b().c` or `a.b[0].c`, only `a.b` refers to a definition
+    parts = []
+    for part in name.split('.'):
+        end = len(part)
+        for c in '([':
+            i = part.find(c)
+            if i != -1:
+                end = min(end, i)
+        if end < len(part):
+            if end:
+                parts.append(part[:end])
+            break
+        parts.append(part)
+    return parts
+
+
 class AutoSlim:
     FileLevel = FileLevelCodeGenerator
     SegmentLevel = SegmentCodeGenerator
@@ -762,9 +3225,33 @@ class AutoSlim:
         entries: LIST_OR_ITEM[str],
         target_dir: str,
         refactor_info: Optional[Dict[str, str]] = None,
+        resolver: Union[str, ModuleResolver, None] = None,
+        cache_dir: Optional[str] = None,
+        jobs: int = 1,
+        keep_ast: bool = False,
+        trace: str = 'file',
+        emitter: Union[str, Emitter, None] = None,
+        copy_through: bool = True,
+        lazy_imports: bool = False,
+        heavy_modules: Sequence[str] = (),
+        package_init: bool = False,
+        memory_limit: Optional[int] = None,
     ):
         self.entries = entries
         self.target_dir = target_dir
+        self.resolver = resolver
+        self.cache_dir = cache_dir
+        self.jobs = jobs
+        self.keep_ast = keep_ast
+        self.trace = trace
+        self.emitter = emitter
+        self.copy_through = copy_through
+        self.lazy_imports = lazy_imports
+        self.heavy_modules = heavy_modules
+        self.package_init = package_init
+        self.memory_limit = memory_limit
+        self.parser: Optional[Parser] = None
+        self.codegen: Optional[FileLevelCodeGenerator] = None
         self._mode = AutoSlim.FileLevel
         self._refactor_info = refactor_info or {}
         # Maybe we can name this O1 like optimization of gcc hh
@@ -783,9 +3270,160 @@ class AutoSlim:
         self._entry_type = type
         return self
 
-    def generate(self):
-        entry = self._entry_type(self.entries)
-        parser = Parser(entry)
-        codegen = self._mode(self.target_dir, parser, class_merge_level=self._merge_class)
-        codegen.generate()
+    def generate(self, profile: bool = False):
+        """Slim the entries into `target_dir`, `profile` records the timings and counters
+        reported by `stats`."""
+        self.parser = self._build_parser(profile)
+        self.codegen = self._build_codegen(self.parser)
+        self.codegen.generate()
+        return self
+
+    def iter_generate(self, profile: bool = False) -> Iterator[GeneratedFile]:
+        """Slim the entries into `target_dir` like `generate`, yields a `GeneratedFile`
+        as soon as each output is written.
+
+        At file level an output only depends on its own file, so it is generated
+        once the imports of the file are resolved, in the order the files are traced,
+        and its ast is released before the files it imports are parsed. At segment
+        level, or with the 'symbol' trace, the outputs are generated once the whole
+        import graph is traced. The outputs are generated in this process.
+
+        The outputs written are recorded in the manifest even if the iteration is
+        stopped early, the stale outputs are only removed once it is exhausted.
+        """
+        parser = self.parser = self._build_parser(profile, analyze=False)
+        streams = self._mode.standalone and self.trace != 'symbol'
+        codegen = self.codegen = self._build_codegen(parser) if streams else None
+        try:
+            if codegen is not None:
+                codegen.makedirs(self.target_dir)
+            for files in parser.iter_parse():
+                if codegen is not None:
+                    yield from codegen._iter_generate(files)
+            if codegen is None:
+                codegen = self.codegen = self._build_codegen(parser)
+                codegen.makedirs(self.target_dir)
+                yield from codegen._iter_generate(list(parser.get_parsers()))
+            if codegen.package_init:
+                start = time.perf_counter()
+                writes = codegen.output.writes
+                path = codegen._generate_package_init()
+                if path is not None:
+                    yield codegen._generated(None, path, writes, start)
+            codegen.output.prune()
+        finally:
+            if codegen is not None:
+                codegen.output.save()
+
+    def _build_parser(self, profile=False, analyze=True):
+        return Parser(
+            self._entry_type(self.entries),
+            resolver=self.resolver,
+            cache_dir=self.cache_dir,
+            jobs=self.jobs,
+            keep_ast=self.keep_ast,
+            trace=self.trace,
+            profile=profile,
+            analyze=analyze,
+            memory_limit=self.memory_limit,
+        )
+
+    def _build_codegen(self, parser):
+        return self._mode(
+            self.target_dir,
+            parser,
+            class_merge_level=self._merge_class,
+            emitter=self.emitter,
+            copy_through=self.copy_through,
+            jobs=self.jobs,
+            lazy_imports=self.lazy_imports,
+            heavy_modules=self.heavy_modules,
+            package_init=self.package_init,
+        )
+
+    def update(self, changed_paths: LIST_OR_ITEM[str]) -> List[str]:
+        """Slim again after `changed_paths` changed, returns the paths written.
+
+        Only the changed files are parsed again, and only the outputs depending
+        on them are generated again.
+        """
+        if self.parser is None:
+            self.generate()
+            return [self.codegen._get_target_path(i) for i in self.parser.get_parsers()]
+        if isinstance(changed_paths, str):
+            changed_paths = [changed_paths]
+        changed_paths = [os.path.abspath(i) for i in changed_paths]
+        # files imported before the change may lose their importers
+        neighbors = [p for i in changed_paths for p in self.parser.relations.get(i, ())]
+        files, removed = self.parser.update(changed_paths)
+        return self.codegen.update(files, removed, neighbors)
+
+    def stats(self, path: Optional[str] = None, top: int = 10) -> Optional[Dict[str, Any]]:
+        """Wall and cpu time per phase and per file, counters and the `top` slowest
+        files of the last `generate(profile=True)` and the updates since.
+
+        The cache, output and memory statistics are reported without profiling too,
+        the phases and files are empty then. Dumped as json to `path` if given.
+        Returns None before the first generation.
+        """
+        if self.parser is None:
+            return None
+        parser = self.parser
+        caches = {'resolution': parser.resolution_cache.stats()}
+        if parser.parse_cache is not None:
+            caches['parse'] = parser.parse_cache.stats()
+        outputs = self.codegen.output.stats()
+        extra = {'caches': caches, 'outputs': outputs}
+        if parser.budget is not None:
+            extra['memory'] = parser.budget.stats()
+        if path is not None:
+            parser.stats.to_json(path, top, **extra)
+        data = parser.stats.to_dict(top)
+        data.update(extra)
+        return data
+
+    def _get_stamps(self):
+        stamps = {}
+        for file in self.parser.get_parsers():
+            try:
+                stat = os.stat(file)
+            except OSError:
+                continue
+            stamps[file] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    def watch(
+        self,
+        interval: float = 1.0,
+        callback: Optional[Callable[[List[str], List[str]], Any]] = None,
+        max_rounds: Optional[int] = None,
+    ):
+        """Poll the traced files every `interval` seconds and `update` on changes.
+
+        `callback` is called with the changed files and the paths written.
+        """
+        if self.parser is None:
+            self.generate()
+        stamps = self._get_stamps()
+        rounds = 0
+        while max_rounds is None or rounds < max_rounds:
+            time.sleep(interval)
+            rounds += 1
+            new_stamps = self._get_stamps()
+            changed = sorted(
+                i for i in stamps.keys() | new_stamps.keys() if stamps.get(i) != new_stamps.get(i)
+            )
+            if not changed:
+                continue
+            try:
+                written = self.update(changed)
+            except SyntaxError as e:
+                # probably saved in the middle of editing, try again on the next change
+                warnings.warn(f'Skip update: {e}')
+                stamps = new_stamps
+                continue
+            if callback is not None:
+                callback(changed, written)
+            # newly traced files are watched as well
+            stamps = self._get_stamps()
         return self
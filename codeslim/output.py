@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import os.path as osp
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from .cache import _atomic_write
+
+MANIFEST = '.codeslim-manifest.json'
+_STAGING = '.codeslim-staging'
+_MANIFEST_VERSION = 1
+
+
+class OutputTree:
+    """The files generated into `target_dir`, only written when their content changes.
+
+    Files are written into a staging directory and renamed over the outputs, so
+    readers never see partial files. The sha1 and size of the outputs are kept in
+    a manifest in `target_dir`; `prune` removes the outputs of the previous run
+    which were not generated again.
+    """
+
+    def __init__(self, target_dir: str) -> None:
+        self.target_dir = osp.abspath(target_dir)
+        self.manifest_path = osp.join(self.target_dir, MANIFEST)
+        self.staging_dir = osp.join(self.target_dir, _STAGING)
+        # relative path -> {'sha1', 'size', 'mtime_ns'}
+        self.files: Dict[str, Dict[str, Any]] = self._load_manifest()
+        self._saved = {k: dict(v) for k, v in self.files.items()}
+        # outputs generated since the last `prune`
+        self.generated = set()
+        self.writes = 0
+        self.unchanged = 0
+        self.removes = 0
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='UTF-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(manifest, dict) or manifest.get('version') != _MANIFEST_VERSION:
+            return {}
+        return manifest.get('files', {})
+
+    def _key(self, path: str) -> str:
+        return osp.relpath(osp.abspath(path), self.target_dir).replace(os.sep, '/')
+
+    def is_current(self, path: str, digest: str, size: int) -> bool:
+        """Whether `path` already holds the content of sha1 `digest` and `size` bytes."""
+        key = self._key(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_size != size:
+            return False
+        entry = self.files.get(key)
+        if entry is None or entry['mtime_ns'] != stat.st_mtime_ns:
+            # not written by us, or touched since
+            with open(path, 'rb') as f:
+                if hashlib.sha1(f.read()).hexdigest() != digest:
+                    return False
+        elif entry['sha1'] != digest:
+            return False
+        self._record(key, digest, size, stat.st_mtime_ns)
+        self.unchanged += 1
+        return True
+
+    def write(self, path: str, data: bytes) -> bool:
+        """Write `data` to `path` unless it is already there, returns whether it was written."""
+        digest = hashlib.sha1(data).hexdigest()
+        if self.is_current(path, digest, len(data)):
+            return False
+        with self.staged(path, digest) as f:
+            f.write(data)
+        return True
+
+    @contextmanager
+    def staged(self, path: str, digest: str):
+        """A file to write the content of sha1 `digest` to, renamed to `path` on exit."""
+        os.makedirs(self.staging_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.staging_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                yield f
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        stat = os.stat(path)
+        self._record(self._key(path), digest, stat.st_size, stat.st_mtime_ns)
+        self.writes += 1
+
+    def _record(self, key, digest, size, mtime_ns):
+        self.files[key] = {'sha1': digest, 'size': size, 'mtime_ns': mtime_ns}
+        self.generated.add(key)
+
+    def entry(self, path: str) -> Optional[Dict[str, Any]]:
+        return self.files.get(self._key(path))
+
+    def add(self, path: str, entry: Dict[str, Any], written: bool) -> None:
+        """Record an output generated by another process."""
+        key = self._key(path)
+        self.files[key] = entry
+        self.generated.add(key)
+        if written:
+            self.writes += 1
+        else:
+            self.unchanged += 1
+
+    def remove(self, path: str) -> None:
+        key = self._key(path)
+        self.files.pop(key, None)
+        self.generated.discard(key)
+        if osp.exists(path):
+            os.remove(path)
+            self.removes += 1
+
+    def prune(self) -> None:
+        """Remove the outputs in the manifest which were not generated since the last prune."""
+        for key in [i for i in self.files if i not in self.generated]:
+            self.remove(osp.join(self.target_dir, key))
+        self.generated = set()
+
+    def save(self) -> None:
+        """Write the manifest if it changed."""
+        try:
+            os.rmdir(self.staging_dir)
+        except OSError:
+            pass
+        if self.files == self._saved:
+            return
+        manifest = {'version': _MANIFEST_VERSION, 'files': dict(sorted(self.files.items()))}
+        _atomic_write(self.manifest_path, (json.dumps(manifest, indent=2) + '\n').encode('UTF-8'))
+        self._saved = {k: dict(v) for k, v in self.files.items()}
+
+    def stats(self):
+        return {'writes': self.writes, 'unchanged': self.unchanged, 'removes': self.removes}
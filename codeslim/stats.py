@@ -0,0 +1,119 @@
+import json
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+PHASES = ('read', 'parse', 'visit', 'resolve', 'load', 'spill', 'rewrite', 'emit', 'write')
+
+
+class _Timer:
+    __slots__ = ('stats', 'phase', 'file', 'wall', 'cpu')
+
+    def __init__(self, stats, phase, file):
+        self.stats = stats
+        self.phase = phase
+        self.file = file
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.add(
+            self.phase, time.perf_counter() - self.wall, time.process_time() - self.cpu, self.file
+        )
+
+
+class Stats:
+    """Wall and cpu time per phase and per file, and counters of a slim.
+
+    Phases are timed with `with stats.phase('parse', file): ...`, counters are
+    increased with `stats.count('files_parsed')`.
+    """
+
+    enabled = True
+
+    def __init__(self) -> None:
+        # phase -> [wall, cpu, calls]
+        self.phases: Dict[str, List[float]] = {}
+        # file -> phase -> wall
+        self.files: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self.counters: Counter = Counter()
+
+    def phase(self, name: str, file: Optional[str] = None) -> _Timer:
+        return _Timer(self, name, file)
+
+    def add(self, name: str, wall: float, cpu: float, file: Optional[str] = None) -> None:
+        record = self.phases.get(name)
+        if record is None:
+            record = self.phases[name] = [0.0, 0.0, 0]
+        record[0] += wall
+        record[1] += cpu
+        record[2] += 1
+        if file is not None:
+            times = self.files[file]
+            times[name] = times.get(name, 0.0) + wall
+
+    def count(self, name: str, value: int = 1) -> None:
+        self.counters[name] += value
+
+    def slowest(self, n: int = 10) -> List[Tuple[str, float]]:
+        totals = [(file, sum(times.values())) for file, times in self.files.items()]
+        totals.sort(key=lambda i: i[1], reverse=True)
+        return totals[:n]
+
+    def to_dict(self, top: int = 10) -> Dict[str, Any]:
+        ordered = [i for i in PHASES if i in self.phases] + sorted(
+            i for i in self.phases if i not in PHASES
+        )
+        return {
+            'phases': {
+                i: {'wall': self.phases[i][0], 'cpu': self.phases[i][1], 'calls': self.phases[i][2]}
+                for i in ordered
+            },
+            'counters': dict(self.counters),
+            'slowest': [{'file': file, 'wall': wall} for file, wall in self.slowest(top)],
+            'files': {file: dict(times) for file, times in self.files.items()},
+        }
+
+    def to_json(self, path: Optional[str] = None, top: int = 10, **extra) -> str:
+        """Dump `to_dict` merged with `extra` as json, written to `path` if given."""
+        data = self.to_dict(top)
+        data.update(extra)
+        dumped = json.dumps(data, indent=2)
+        if path is not None:
+            with open(path, 'w', encoding='UTF-8') as f:
+                f.write(dumped)
+        return dumped
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _NullStats(Stats):
+    """Used when profiling is disabled, records nothing."""
+
+    enabled = False
+
+    def phase(self, name, file=None):
+        return _NULL_TIMER
+
+    def add(self, name, wall, cpu, file=None):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+
+NULL_STATS = _NullStats()
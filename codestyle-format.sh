@@ -40,5 +40,7 @@ format() {
 # echo $check_only
 echo "format 'tests'"
 format "tests/" false
+echo "format 'benchmarks'"
+format "benchmarks/" false
 echo "format 'codeslim'"
 format "codeslim/" true 
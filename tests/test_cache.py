@@ -0,0 +1,12 @@
+from codeslim import DefaultASTParser, ParseCache
+
+
+class CustomParser(DefaultASTParser):
+    pass
+
+
+def test_parse_cache_keyed_by_parser(tmp_path):
+    default = ParseCache(str(tmp_path), DefaultASTParser)
+    custom = ParseCache(str(tmp_path), CustomParser)
+    assert default.cache_dir != custom.cache_dir
+    assert ParseCache(str(tmp_path), DefaultASTParser).cache_dir == default.cache_dir
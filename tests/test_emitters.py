@@ -0,0 +1,52 @@
+import ast
+
+import pytest
+
+from codeslim import Emitter, SliceEmitter, UnparseEmitter
+
+
+def _emit(tmp_path, source, keep):
+    path = tmp_path / 'mod.py'
+    path.write_text(source)
+    tree = ast.parse(source)
+    tree.body = [i for i in tree.body if getattr(i, 'name', None) in keep or not hasattr(i, 'name')]
+    return SliceEmitter()(tree, str(path))
+
+
+def test_slice_keeps_comments_between_statements(tmp_path):
+    source = 'import os\n\n# a comment\nx = 1  ;\\\n\ny = 2\n'
+    assert _emit(tmp_path, source, ()) == source
+
+
+def test_slice_banner_before_removed_def(tmp_path):
+    # the gap holding the removed def must not backtrack over the banner
+    banner = '#' * 200
+    source = f'import os\n\n{banner}\ndef dead():\n    pass\n\n\ndef live():\n    pass\n'
+    emitted = _emit(tmp_path, source, ('live',))
+    assert 'dead' not in emitted
+    assert emitted.startswith('import os\n') and emitted.endswith('def live():\n    pass\n')
+
+
+def test_slice_keeps_trailing_comment_before_removed_def(tmp_path):
+    source = 'import os  # noqa: F401\n\n\ndef dead():\n    pass\n\n\nX = 1  # the end\n'
+    emitted = _emit(tmp_path, source, ())
+    assert emitted == 'import os  # noqa: F401\nX = 1  # the end\n'
+
+
+def test_unparse_emitter():
+    source = 'import os\n\n# dropped\nx  =  [1,\n      2]\n'
+    assert UnparseEmitter()(ast.parse(source)) == 'import os\nx = [1, 2]\n'
+
+
+def test_unknown_emitter():
+    with pytest.raises(ValueError):
+        SliceEmitter(fallback='black')
+
+
+def test_slice_falls_back_without_file():
+    class _Dump(Emitter):
+        def __call__(self, tree, file_name=None):
+            return ast.dump(tree)
+
+    tree = ast.parse('x = 1\n')
+    assert SliceEmitter(fallback=_Dump())(tree) == ast.dump(tree)
@@ -0,0 +1,106 @@
+import sys
+
+import pytest
+
+from codeslim import (
+    EndPoint,
+    EndPointManager,
+    ExceptEndPoint,
+    FileEntry,
+    LocalEndPoint,
+    Parser,
+    StaticResolver,
+)
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / 'proj').mkdir()
+    return tmp_path / 'proj'
+
+
+def _check(manager, file_path, module_name):
+    return manager.check({'file_path': str(file_path), 'module_name': module_name})
+
+
+@pytest.mark.parametrize(
+    'module_name, excepted',
+    [
+        ('torch', False),
+        ('torch.nn', True),
+        ('torch.nn.functional', True),
+        ('torchvision', False),
+        ('numpy', True),
+        ('numpy.linalg', False),
+        ('mylib_a.ops', True),
+        ('mylib_a.ops.extra', False),
+    ],
+)
+def test_except_patterns(project, module_name, excepted):
+    endpoint = ExceptEndPoint(str(project / 'main.py'), ['torch.*', 'numpy', 'mylib_*.ops'])
+    manager = EndPointManager([endpoint])
+    # outside of the project, traced only if excepted
+    assert _check(manager, '/elsewhere/mod.py', module_name) is not excepted
+    # the project itself is always traced
+    assert not _check(manager, project / 'mod.py', module_name)
+
+
+def test_local_endpoint(project):
+    manager = EndPointManager([LocalEndPoint(str(project / 'main.py'))])
+    assert not _check(manager, project / 'pkg' / 'mod.py', 'pkg.mod')
+    assert _check(manager, project.parent / 'other' / 'mod.py', 'mod')
+    # decided once per file and module
+    assert _check(manager, project.parent / 'other' / 'mod.py', 'mod')
+    assert len(manager._matcher.memo) == 2
+
+
+class _ModuleEndPoint(EndPoint):
+    __target__ = ['module_name']
+
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, module_name):
+        return module_name == self.name
+
+
+def test_matcher_compiled_again_when_endpoints_change(project):
+    manager = EndPointManager([LocalEndPoint(str(project / 'main.py'))])
+    assert not _check(manager, project / 'a.py', 'a')
+    assert not manager.check_module('a')
+
+    manager.endpoints.append(_ModuleEndPoint('a'))
+    assert _check(manager, project / 'a.py', 'a')
+    assert manager.check_module('a')
+
+
+class _RecordingResolver(StaticResolver):
+    def __init__(self):
+        super().__init__()
+        self.resolved = []
+
+    def __call__(self, module_name, level=0, base_dir=None):
+        self.resolved.append(module_name)
+        return super().__call__(module_name, level, base_dir)
+
+
+def test_stdlib_imports_are_not_resolved(project):
+    (project / 'main.py').write_text('import os\nimport json.decoder\nimport sys\nimport a\n')
+    (project / 'a.py').write_text('from collections import OrderedDict\n')
+    resolver = _RecordingResolver()
+    parser = Parser(FileEntry(str(project / 'main.py')), resolver=resolver)
+
+    assert resolver.resolved == ['a']
+    assert list(parser.get_parsers()) == [str(project / 'main.py'), str(project / 'a.py')]
+
+
+def test_local_module_shadows_stdlib(project, monkeypatch):
+    # as when main.py is run, its directory comes first
+    monkeypatch.setattr(sys, 'path', [''] + sys.path)
+    (project / 'main.py').write_text('import colorsys\n')
+    (project / 'colorsys.py').write_text('')
+    resolver = _RecordingResolver()
+    parser = Parser(FileEntry(str(project / 'main.py')), resolver=resolver)
+
+    assert resolver.resolved == ['colorsys']
+    assert str(project / 'colorsys.py') in parser.get_parsers()
@@ -0,0 +1,143 @@
+import json
+import os
+import os.path as osp
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from codeslim import CODEGEN_PREFIX, AutoSlim
+from codeslim.output import MANIFEST
+
+
+@pytest.fixture
+def entry(tmp_path):
+    # src/main.py importing the modules a and b
+    src = tmp_path / 'src'
+    src.mkdir()
+    (src / 'main.py').write_text('import a\nimport b\n\nprint(a.A + b.B)\n')
+    (src / 'a.py').write_text('A = 1\n')
+    (src / 'b.py').write_text('B = 2\n')
+    return src / 'main.py'
+
+
+@pytest.fixture
+def out(tmp_path):
+    return tmp_path / 'out'
+
+
+def test_iter_generate_records_outputs_when_stopped(entry, out):
+    outputs = AutoSlim(str(entry), str(out), resolver='static').iter_generate()
+    first = next(outputs)
+    outputs.close()
+
+    with open(out / MANIFEST) as f:
+        files = json.load(f)['files']
+    assert list(files) == [osp.relpath(first.path, out)]
+
+
+def test_stats_without_profiling(entry, out):
+    slim = AutoSlim(str(entry), str(out), resolver='static', memory_limit=0)
+    assert slim.stats() is None
+    slim.generate()
+
+    stats = slim.stats()
+    assert stats['phases'] == {}
+    assert stats['memory']['limit'] == 0
+    assert stats['outputs']['writes'] > 0
+
+
+def test_profile_times_each_file(entry, out):
+    slim = AutoSlim(str(entry), str(out), resolver='static')
+    slim.generate(profile=True)
+
+    files = slim.stats()['files']
+    for name in ('main.py', 'a.py', 'b.py'):
+        assert {'read', 'parse', 'visit', 'resolve'} <= set(files[str(entry.parent / name)])
+
+
+@pytest.mark.parametrize('emitter', ['astor', 'unparse', 'slice'])
+@pytest.mark.parametrize('mode', [AutoSlim.FileLevel, AutoSlim.SegmentLevel])
+def test_latin1_source(entry, out, mode, emitter):
+    entry.write_text('from a import name\n\nprint(name())\n')
+    (entry.parent / 'a.py').write_bytes(
+        b'# -*- coding: latin-1 -*-\nimport os\n\n\ndef name():\n    return "caf\xe9"\n'
+    )
+    slim = AutoSlim(str(entry), str(out), resolver='static', emitter=emitter).mode(mode)
+    slim.generate()
+
+    result = subprocess.run([sys.executable, 'main.py'], cwd=out, capture_output=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.decode('utf-8') == 'caf\xe9\n'
+
+
+def test_unparse_emitter(entry, out):
+    (entry.parent / 'a.py').write_text('# dropped\nA  =  (1)\n')
+    slim = AutoSlim(str(entry), str(out), resolver='static', emitter='unparse', copy_through=False)
+    slim.generate()
+
+    assert (out / 'a.py').read_text() == CODEGEN_PREFIX + 'A = 1\n'
+    assert (
+        out / 'main.py'
+    ).read_text() == CODEGEN_PREFIX + 'import a\nimport b\nprint(a.A + b.B)\n'
+
+
+@pytest.mark.parametrize('bom', [b'', b'\xef\xbb\xbf'])
+def test_copy_through_keeps_source_bytes(entry, out, bom):
+    source = '# café\r\nA  =  (1)  # one\r\n\r\n'.encode('utf-8')
+    (entry.parent / 'a.py').write_bytes(bom + source)
+    AutoSlim(str(entry), str(out), resolver='static', emitter='unparse').generate()
+
+    # the BOM would not be first after the prefix
+    assert (out / 'a.py').read_bytes() == CODEGEN_PREFIX.encode() + source
+
+
+@pytest.mark.parametrize('copy_through', [True, False])
+@pytest.mark.parametrize('mode', [AutoSlim.FileLevel, AutoSlim.SegmentLevel])
+def test_rerun_writes_nothing(entry, out, mode, copy_through):
+    def generate():
+        slim = AutoSlim(str(entry), str(out), resolver='static', copy_through=copy_through)
+        slim.mode(mode).generate()
+        return slim.stats()['outputs']
+
+    assert generate()['writes'] > 0
+    mtimes = {p: p.stat().st_mtime_ns for p in out.rglob('*')}
+
+    outputs = generate()
+    assert outputs['writes'] == 0 and outputs['removes'] == 0
+    assert outputs['unchanged'] > 0
+    assert {p: p.stat().st_mtime_ns for p in out.rglob('*')} == mtimes
+
+
+@pytest.mark.parametrize('resolver', ['static', 'import'])
+def test_concurrent_generate(tmp_path, monkeypatch, resolver):
+    # the projects share the module names, each one must find its own
+    monkeypatch.setattr(sys, 'path', [''] + sys.path)
+    jobs = 4
+    for i in range(jobs):
+        src = tmp_path / f'src{i}'
+        src.mkdir()
+        (src / 'main.py').write_text('import a\n\nprint(a.A)\n')
+        (src / 'a.py').write_text(f'from b import B\n\nA = B + {i}\n')
+        (src / 'b.py').write_text('B = 10\n')
+    start = threading.Barrier(jobs)
+    cwd = os.getcwd()
+
+    def generate(i):
+        entry = tmp_path / f'src{i}' / 'main.py'
+        slim = AutoSlim(str(entry), str(tmp_path / f'out{i}'), resolver=resolver)
+        start.wait()
+        slim.generate()
+
+    with ThreadPoolExecutor(jobs) as pool:
+        list(pool.map(generate, range(jobs)))
+
+    assert os.getcwd() == cwd
+    for i in range(jobs):
+        result = subprocess.run(
+            [sys.executable, 'main.py'], cwd=tmp_path / f'out{i}', capture_output=True
+        )
+        assert result.returncode == 0, result.stderr
+        assert result.stdout == f'{10 + i}\n'.encode()
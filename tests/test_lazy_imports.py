@@ -0,0 +1,76 @@
+import ast
+import types
+
+from codeslim import LazyImports
+
+
+def _rewrite(source, modules=None):
+    tree = ast.parse(source)
+    deferred = LazyImports(modules).rewrite(tree)
+    return deferred, ast.unparse(tree)
+
+
+def _load(source, name='lazy_module'):
+    module = types.ModuleType(name)
+    exec(compile(source, name, 'exec'), module.__dict__)
+    return module
+
+
+def test_import_moves_into_function():
+    deferred, source = _rewrite('import json\n\n\ndef f():\n    return json.dumps(1)\n')
+    assert deferred
+    assert source.startswith('def f():\n    import json\n')
+    assert _load(source).f() == '1'
+
+
+def test_parameter_shadows_import():
+    deferred, source = _rewrite(
+        'import json\n\n\ndef f(json):\n    return json\n\n\ndef g():\n    return json.dumps(1)\n'
+    )
+    assert deferred
+    module = _load(source)
+    assert module.f(5) == 5
+    assert module.g() == '1'
+    assert 'def f(json):\n    return json' in source
+
+
+def test_local_bindings_shadow_import():
+    deferred, source = _rewrite(
+        'import json\n\n\n'
+        'def f():\n'
+        '    try:\n        raise ValueError\n'
+        '    except ValueError as json:\n        return json\n\n\n'
+        'def g():\n    json = 2\n    return json\n\n\n'
+        'def h():\n    return (lambda json: json)(3)\n'
+    )
+    assert deferred
+    assert 'import json' not in source.split('def __getattr__')[0]
+    module = _load(source)
+    assert isinstance(module.f(), ValueError)
+    assert module.g() == 2
+    assert module.h() == 3
+
+
+def test_module_level_use_keeps_import():
+    deferred, source = _rewrite(
+        'import json\n\nDUMPS = json.dumps\n\n\ndef f():\n    return json\n'
+    )
+    assert not deferred
+    assert source.startswith('import json\n')
+
+
+def test_only_heavy_modules_deferred():
+    deferred, source = _rewrite(
+        'import json\nimport os\n\n\ndef f():\n    return json, os\n', modules=['json']
+    )
+    assert deferred
+    assert source.startswith('import os\n')
+    assert 'import json' in source
+
+
+def test_getattr_imports_on_first_access():
+    _, source = _rewrite('import json\n\n\ndef f():\n    return json\n')
+    module = _load(source)
+    assert 'json' not in vars(module)
+    assert module.json.dumps(1) == '1'
+    assert 'json' in vars(module)
@@ -0,0 +1,22 @@
+import ast
+from pathlib import Path
+
+from codeslim import FileEntry, Parser
+
+
+class _RecordingEntry(FileEntry):
+    converted = []
+
+    def convert_to_ast(self, entries):
+        self.converted.extend(entries)
+        return [ast.parse(Path(i).read_bytes(), i) for i in entries]
+
+
+def test_entry_converting_its_files(tmp_path):
+    (tmp_path / 'main.py').write_text('import a\n')
+    (tmp_path / 'a.py').write_text('A = 1\n')
+    parser = Parser(_RecordingEntry(str(tmp_path / 'main.py')), resolver='static')
+
+    files = [str(tmp_path / 'main.py'), str(tmp_path / 'a.py')]
+    assert list(parser.get_parsers()) == files
+    assert _RecordingEntry.converted == files
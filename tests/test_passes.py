@@ -0,0 +1,80 @@
+import ast
+
+import pytest
+
+from codeslim import PassManager, RewritePass
+
+
+def _rename(old, new):
+    def handler(node):
+        if node.id == old:
+            node.id = new
+        return node
+
+    return handler
+
+
+def _names(seen):
+    # records the names visited, in order
+    def handler(node):
+        seen.append(node.id)
+        return node
+
+    return handler
+
+
+def test_schedule_fuses_passes_unless_required():
+    manager = PassManager(
+        [
+            RewritePass('count', {}, requires=['rename']),
+            RewritePass('rename', {}),
+            RewritePass('check', {}, after=['rename']),
+        ]
+    )
+    stages = [[p.name for p in stage] for stage in manager.schedule()]
+    assert stages == [['rename', 'check'], ['count']]
+
+
+def test_required_pass_sees_the_whole_rewritten_tree():
+    seen = []
+    manager = PassManager(
+        [
+            RewritePass('count', {'Name': _names(seen)}, requires=['rename']),
+            RewritePass('rename', {'Name': _rename('a', 'b')}),
+        ]
+    )
+    tree = manager.run(ast.parse('a = 1\nprint(a)\n'))
+
+    assert seen == ['b', 'print', 'b']
+    assert ast.unparse(tree) == 'b = 1\nprint(b)'
+
+
+def test_after_orders_handlers_on_the_same_node():
+    seen = []
+    manager = PassManager(
+        [
+            RewritePass('count', {'Name': _names(seen)}, after=['rename']),
+            RewritePass('rename', {'Name': _rename('a', 'b')}),
+        ]
+    )
+    manager.run(ast.parse('a = 1\n'))
+
+    assert len(manager.schedule()) == 1
+    assert seen == ['b']
+
+
+@pytest.mark.parametrize(
+    'passes',
+    [
+        [RewritePass('a', {}, requires=['b']), RewritePass('b', {}, after=['a'])],
+        [RewritePass('a', {}, after=['missing'])],
+    ],
+)
+def test_invalid_dependencies(passes):
+    with pytest.raises(ValueError):
+        PassManager(passes).schedule()
+
+
+def test_duplicated_pass():
+    with pytest.raises(ValueError):
+        PassManager([RewritePass('a', {}), RewritePass('a', {})])
@@ -0,0 +1,37 @@
+import sys
+
+import pytest
+
+from codeslim import CachedResolver, ImportResolver, StaticResolver
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for path in ('lib/cs_shadowed.py', 'a/main.py', 'b/main.py', 'b/cs_shadowed.py'):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text('')
+    yield tmp_path
+    sys.modules.pop('cs_shadowed', None)
+
+
+@pytest.mark.parametrize('resolver_type', [ImportResolver, StaticResolver])
+def test_sibling_shadows_cached_module(tree, monkeypatch, resolver_type):
+    # '' stands for the directory of the importer
+    monkeypatch.setattr(sys, 'path', ['', str(tree / 'lib')] + sys.path)
+    resolver = CachedResolver(resolver_type())
+    assert resolver('cs_shadowed', 0, str(tree / 'a')) == str(tree / 'lib' / 'cs_shadowed.py')
+    assert resolver('cs_shadowed', 0, str(tree / 'b')) == str(tree / 'b' / 'cs_shadowed.py')
+    # resolved once, and shared by the other importers without a sibling
+    assert resolver.cache.lookup('cs_shadowed') == (True, str(tree / 'lib' / 'cs_shadowed.py'))
+
+
+@pytest.mark.parametrize('resolver_type', [ImportResolver, StaticResolver])
+def test_module_before_namespace_portion(tmp_path, monkeypatch, resolver_type):
+    (tmp_path / 'cs_portion').mkdir()
+    (tmp_path / 'cs_portion' / 'bar.py').write_text('')
+    (tmp_path / 'cs_portion.py').write_text('')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    try:
+        assert resolver_type()('cs_portion', 0, str(tmp_path)) == str(tmp_path / 'cs_portion.py')
+    finally:
+        sys.modules.pop('cs_portion', None)
@@ -0,0 +1,83 @@
+import subprocess
+import sys
+
+import pytest
+
+from codeslim import AutoSlim
+
+FILES = {
+    'main.py': (
+        'import pkg.other as other\n'
+        'from pkg.utils import helper\n\n'
+        'print(helper(), other.Thing().value)\n'
+    ),
+    'pkg/__init__.py': '',
+    'pkg/utils.py': (
+        'from .heavy import big\n\n\n'
+        'def helper():\n    return 1\n\n\n'
+        'def other_helper():\n    return big()\n'
+    ),
+    'pkg/heavy.py': 'def big():\n    return 2\n',
+    'pkg/other.py': 'class Thing:\n    value = 3\n\n\ndef dead():\n    return 4\n',
+}
+
+
+def _write_project(root):
+    for name, source in FILES.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(source)
+    return root / 'main.py'
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+@pytest.mark.parametrize('trace', ['file', 'symbol'])
+@pytest.mark.parametrize('mode', [AutoSlim.FileLevel, AutoSlim.SegmentLevel])
+def test_slimmed_output_imports(tmp_path, mode, trace, jobs):
+    entry = _write_project(tmp_path / 'src')
+    out = tmp_path / 'out'
+    AutoSlim(str(entry), str(out), resolver='static', trace=trace, jobs=jobs).mode(mode).generate()
+
+    result = subprocess.run([sys.executable, 'main.py'], cwd=out, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == '1 3\n'
+    if mode is AutoSlim.SegmentLevel:
+        # neither the dead definitions nor the imports only they use are kept
+        assert 'dead' not in (out / 'other.py').read_text()
+        assert 'big' not in (out / 'utils.py').read_text()
+        assert (out / 'heavy.py').exists() == (trace == 'file')
+
+
+@pytest.mark.parametrize('mode', [AutoSlim.FileLevel, AutoSlim.SegmentLevel])
+def test_update_drops_files_no_longer_imported(tmp_path, mode):
+    entry = _write_project(tmp_path / 'src')
+    out = tmp_path / 'out'
+    slim = AutoSlim(str(entry), str(out), resolver='static', package_init=True).mode(mode)
+    slim.generate()
+    assert (out / 'heavy.py').exists()
+
+    utils = tmp_path / 'src' / 'pkg' / 'utils.py'
+    utils.write_text('def helper():\n    return 1\n')
+    slim.update(str(utils))
+    assert not (out / 'heavy.py').exists()
+    assert 'heavy' not in (out / '__init__.py').read_text()
+    assert str(tmp_path / 'src' / 'pkg' / 'heavy.py') not in slim.parser.get_parsers()
+
+
+@pytest.mark.parametrize('mode', [AutoSlim.FileLevel, AutoSlim.SegmentLevel])
+def test_package_init_imports(tmp_path, mode):
+    entry = _write_project(tmp_path / 'src')
+    out = tmp_path / 'slim'
+    AutoSlim(str(entry), str(out), resolver='static', package_init=True).mode(mode).generate()
+
+    code = 'import slim; print(slim.helper(), slim.Thing.value, "main" in dir(slim))'
+    result = subprocess.run(
+        [sys.executable, '-c', code], cwd=tmp_path, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == '1 3 False\n'
+    result = subprocess.run(
+        [sys.executable, '-m', 'slim.main'], cwd=tmp_path, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == '1 3\n'